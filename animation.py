@@ -0,0 +1,185 @@
+"""
+Streaming animation output
+
+Frames are encoded into the output as they arrive instead of being collected first, so the memory use does not grow
+with the length of a run. GifSink appends every frame to a GIF file (each frame with its own colour table), and
+RawFrameSink appends the raw pixels to a file that can be encoded later with encode_gif(read_raw_frames(path), ...).
+Both can keep only every Nth frame.
+
+Example, rebuilding a GIF from the saved PNG frames one frame at a time:
+    with GifSink(vac_rate_path / "sim.gif") as sink:
+        for frame in png_frames(vac_rate_path / "Plots" / "agents"):
+            sink.add_frame(frame)
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+# Time each frame of the GIFs is shown for, in milliseconds.
+frame_duration = 200
+
+
+def frame_number(path_object):
+    """
+    This function returns the time step of a saved frame from its <time>_agents.png name.
+    """
+    return int(path_object.name.split("_")[0])
+
+
+def png_frames(agents_path):
+    """
+    This function yields the saved frames of a run in time order, opening one file at a time.
+    """
+    for path in sorted(Path(agents_path).glob("*_agents.png"), key=frame_number):
+        with Image.open(path) as image:
+            image.load()
+            yield image
+
+
+def to_image(frame):
+    """
+    This function converts a frame given as a pixel array to an image.
+    """
+    if isinstance(frame, Image.Image):
+        return frame
+    return Image.fromarray(np.asarray(frame))
+
+
+class GifSink:
+    """
+    Writes frames to a looping GIF as they are added. The file is complete once the sink is closed.
+    """
+
+    def __init__(self, path, duration=frame_duration, loop=0, every=1):
+        """
+        Open the GIF at "path". Every frame is shown for "duration" milliseconds and only every "every"-th frame added
+        is kept.
+        """
+        self.path = Path(path)
+        self.duration = duration
+        self.loop = loop
+        self.every = max(int(every), 1)
+        self.frames_added = 0
+        self.frames_written = 0
+        self.size = None
+        self.handle = open(self.path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_frame(self, frame):
+        """
+        This function encodes a frame (image or pixel array) into the GIF, unless it is removed by the decimation.
+        """
+        keep = self.frames_added % self.every == 0
+        self.frames_added += 1
+        if not keep:
+            return
+
+        # Reduce the frame to its own adaptive palette, which is written as a local colour table.
+        image = to_image(frame).convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+
+        # The first frame sets the size of the GIF and its header.
+        if self.size is None:
+            self.size = image.size
+            header, _ = GifImagePlugin.getheader(image.copy(), info={"loop": self.loop, "duration": self.duration})
+            self.handle.write(b"".join(header))
+        elif image.size != self.size:
+            raise ValueError(f"Frame size {image.size} does not match the GIF size {self.size}")
+
+        for data in GifImagePlugin.getdata(image, duration=self.duration, include_color_table=True):
+            self.handle.write(data)
+        self.frames_written += 1
+
+    def close(self):
+        """
+        This function ends the GIF and closes the file. Closing twice is harmless.
+        """
+        if self.handle is None:
+            return
+
+        self.handle.write(b";")
+        self.handle.close()
+        self.handle = None
+
+
+class RawFrameSink:
+    """
+    Appends the RGB pixels of frames to a raw file, with the frame shape and count in a JSON file next to it, for
+    encoding later without going through PNG files.
+    """
+
+    def __init__(self, path, every=1):
+        self.path = Path(path)
+        self.every = max(int(every), 1)
+        self.frames_added = 0
+        self.frames_written = 0
+        self.shape = None
+        self.handle = open(self.path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_frame(self, frame):
+        """
+        This function appends the pixels of a frame (image or pixel array), unless it is removed by the decimation.
+        """
+        keep = self.frames_added % self.every == 0
+        self.frames_added += 1
+        if not keep:
+            return
+
+        pixels = np.asarray(to_image(frame).convert("RGB"))
+        if self.shape is None:
+            self.shape = pixels.shape
+        elif pixels.shape != self.shape:
+            raise ValueError(f"Frame shape {pixels.shape} does not match the frame shape {self.shape}")
+
+        self.handle.write(pixels.tobytes())
+        self.frames_written += 1
+
+    def close(self):
+        """
+        This function closes the raw file and writes the JSON file describing it. Closing twice is harmless.
+        """
+        if self.handle is None:
+            return
+
+        self.handle.close()
+        self.handle = None
+        with open(self.path.with_suffix(".json"), "w") as handle:
+            json.dump({"shape": list(self.shape or (0, 0, 3)), "frames": self.frames_written}, handle)
+
+
+def read_raw_frames(path):
+    """
+    This function yields the frames of a raw frame file as pixel arrays, memory mapped one frame at a time.
+    """
+    path = Path(path)
+    with open(path.with_suffix(".json")) as handle:
+        description = json.load(handle)
+    if description["frames"] == 0:
+        return
+
+    frames = np.memmap(path, dtype=np.uint8, mode="r", shape=(description["frames"], *description["shape"]))
+    for frame in frames:
+        yield frame
+
+
+def encode_gif(frames, path, duration=frame_duration, loop=0, every=1):
+    """
+    This function streams an iterable of frames into a GIF and returns the number of frames written.
+    """
+    with GifSink(path, duration=duration, loop=loop, every=every) as sink:
+        for frame in frames:
+            sink.add_frame(frame)
+    return sink.frames_written
@@ -0,0 +1,250 @@
+"""
+Benchmark suite for the simulation hot paths
+
+Times the single agent update (agent updates per second), a simulated day, drawing a frame and saving the statistics
+for a grid of population sizes, initial infectious fractions, viruses and engines, and the time it takes to import
+the modules that worker processes and the GUI start from, each in a fresh interpreter. The day, frame and save timings are
+the best of several repeats, to keep the noise out of the comparisons. Every case is timed first and then run again
+under tracemalloc for its peak memory, so the tracing does not distort the timings. The results are written
+as JSON, and can be compared against a stored baseline to spot regressions.
+
+Example, storing a baseline and comparing a later change against it:
+    python benchmark.py --output baseline.json
+    python benchmark.py --output after.json --baseline baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from simulation import Simulation, default_params, virus_dict, engines, generators
+
+# The default grid of cases.
+default_sizes = [300, 3000, 30000, 100000]
+default_fractions = [0.01, 0.1]
+default_viruses = list(virus_dict)
+
+# Number of single agent updates timed per case, at most one day's worth.
+update_calls = 20000
+
+# Timings that are compared against the baseline, where lower is better.
+timing_metrics = ("update_seconds", "day_seconds", "observe_seconds", "save_seconds")
+
+# Modules whose import time is measured.
+default_imports = ["simulation", "sweep", "viral_sim_base"]
+
+
+def make_simulation(size, fraction, virus, engine, seed, generator="legacy"):
+    """
+    This function builds the simulation of a case, with "fraction" of the population infected at the start.
+    """
+    params = dict(default_params, **virus_dict[virus])
+    return Simulation(params, seed=seed, engine=engine, generator=generator, pop_init=size,
+                      infected_init=max(1, round(fraction * size)))
+
+
+def best_time(function, repeats):
+    """
+    This function returns the shortest of "repeats" timings of a call to "function".
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def time_case(size, fraction, virus, engine, seed=42, repeats=3, generator="legacy"):
+    """
+    This function times the hot paths of one case and returns the metrics.
+    """
+    # Imported here so the benchmark can run the simulation timings without a plotting backend.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from renderer import Renderer
+
+    metrics = {}
+
+    start = time.perf_counter()
+    sim = make_simulation(size, fraction, virus, engine, seed, generator)
+    metrics["initialize_seconds"] = time.perf_counter() - start
+
+    # Single agent updates, only used by the asynchronous and event engines.
+    if engine != "sync":
+        calls = min(update_calls, size)
+        start = time.perf_counter()
+        for _ in range(calls):
+            sim.update()
+        elapsed = time.perf_counter() - start
+        metrics["update_seconds"] = elapsed / calls
+        metrics["updates_per_second"] = calls / elapsed
+
+    # Whole simulated days, every repeat simulates the next day.
+    metrics["day_seconds"] = best_time(sim.update_one_unit_time, repeats)
+
+    # Drawing a frame and rendering it to pixels, as the GUI does before handing it to the frame writer.
+    renderer = Renderer(figure=plt.figure())
+
+    def observe():
+        renderer.draw(sim.snapshot(), force=True)
+        renderer.figure.canvas.draw()
+        np.asarray(renderer.figure.canvas.buffer_rgba())
+
+    observe()
+    metrics["observe_seconds"] = best_time(observe, repeats)
+    plt.close(renderer.figure)
+
+    # Saving the statistics.
+    with tempfile.TemporaryDirectory() as directory:
+        metrics["save_seconds"] = best_time(lambda: sim.save_statistics(Path(directory) / "statistics"), repeats)
+
+    return metrics
+
+
+def peak_memory(size, fraction, virus, engine, seed=42, days=3, generator="legacy"):
+    """
+    This function returns the peak traced memory, in bytes, of initialising a case and simulating "days" days.
+    """
+    tracemalloc.start()
+    try:
+        sim = make_simulation(size, fraction, virus, engine, seed, generator)
+        for _ in range(days):
+            sim.update_one_unit_time()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def import_time(module, repeats=3):
+    """
+    This function returns the shortest of "repeats" timings of importing "module" in a fresh interpreter, not counting
+    the start of the interpreter itself.
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=Path(__file__).parent, stdin=subprocess.DEVNULL).stdout
+        timings.append(float(output.split()[-1]))
+    return min(timings)
+
+
+def environment():
+    """
+    This function describes the machine and code the benchmark ran on.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {"timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()}
+
+
+def case_key(case):
+    return (case["size"], case["fraction"], case["virus"], case["engine"], case.get("generator", "legacy"))
+
+
+def compare(results, baseline, threshold, min_seconds=0.01):
+    """
+    This function compares the timings of the results against a baseline and returns the cases that are slower by
+    more than the threshold ratio, as (case, metric, ratio). Timings shorter than min_seconds are too noisy to count
+    as regressions.
+    """
+    baseline_cases = {case_key(case): case["metrics"] for case in baseline["results"]}
+
+    regressions = []
+    for case in results["results"]:
+        before = baseline_cases.get(case_key(case))
+        if before is None:
+            continue
+        for metric in timing_metrics:
+            if metric in case["metrics"] and before.get(metric):
+                ratio = case["metrics"][metric] / before[metric]
+                print(f"{case_key(case)} {metric}: {ratio:.2f}x")
+                if ratio > threshold and case["metrics"][metric] >= min_seconds:
+                    regressions.append((case_key(case), metric, ratio))
+
+    for module, seconds in results.get("imports", {}).items():
+        before = baseline.get("imports", {}).get(module)
+        if before:
+            ratio = seconds / before
+            print(f"import {module}: {ratio:.2f}x")
+            if ratio > threshold and seconds >= min_seconds:
+                regressions.append((("import", module), "import_seconds", ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the viral simulation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="population sizes")
+    parser.add_argument("--fractions", type=float, nargs="+", default=default_fractions,
+                        help="fractions of the population infected at the start")
+    parser.add_argument("--viruses", nargs="+", choices=list(virus_dict), default=default_viruses, help="viruses")
+    parser.add_argument("--engines", nargs="+", choices=engines, default=list(engines), help="engines")
+    parser.add_argument("--generators", nargs="+", choices=generators, default=["legacy"],
+                        help="random number generators")
+    parser.add_argument("--imports", nargs="*", default=default_imports,
+                        help="modules whose import time is measured, none to skip")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats of the day, frame and save timings")
+    parser.add_argument("--seed", type=int, default=42, help="seed of every case")
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"), help="JSON file for the results")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio against the baseline that counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.01,
+                        help="timings shorter than this are not counted as regressions")
+    args = parser.parse_args(argv)
+
+    results = {"environment": environment(), "results": [], "imports": {}}
+
+    for module in args.imports:
+        results["imports"][module] = import_time(module, args.repeats)
+        print(f"import {module:<16} {results['imports'][module]:.3f}s")
+
+    for size, fraction, virus, engine, generator in itertools.product(args.sizes, args.fractions, args.viruses,
+                                                                      args.engines, args.generators):
+        metrics = time_case(size, fraction, virus, engine, seed=args.seed, repeats=args.repeats, generator=generator)
+        metrics["peak_memory_bytes"] = peak_memory(size, fraction, virus, engine, seed=args.seed, days=args.repeats,
+                                                   generator=generator)
+
+        results["results"].append({"size": size, "fraction": fraction, "virus": virus, "engine": engine,
+                                   "generator": generator, "metrics": metrics})
+        print(f"{size:>7} {fraction:<5} {virus:<8} {engine:<5} {generator:<6} day {metrics['day_seconds']:.3f}s "
+              f"observe {metrics['observe_seconds']:.3f}s save {metrics['save_seconds']:.3f}s "
+              f"peak {metrics['peak_memory_bytes'] / 2 ** 20:.1f}MiB")
+
+    with open(args.output, "w") as handle:
+        json.dump(results, handle, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.threshold, args.min_seconds)
+        for key, metric, ratio in regressions:
+            print(f"Regression: {key} {metric} is {ratio:.2f}x slower than the baseline")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
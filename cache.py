@@ -0,0 +1,172 @@
+"""
+Content-addressed result cache
+
+Runs are cached under a key that hashes everything that determines their outcome: the full parameter set (which
+includes the population size), the seed, the day limit, the engine, the random number generator and the engine
+version. Running a configuration that has been run before returns the stored results instead of simulating it again,
+so sweeps can be rerun and plots iterated on without re-simulating anything.
+
+Every entry is a directory named after its key holding the statistics of the run in the columnar result format (see
+results_io.py) and an entry.json with the inputs of the key. The cache is bounded in size: when it grows past max_bytes
+the least recently used entries are removed. "force" re-simulates a configuration and replaces its entry.
+
+Example:
+    cache = ResultCache()
+    results = cache.run(virus_dict["covid"], seed=42, vac_rate=0.3)
+    results["total_casualty_ts"][-1]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from results_io import Results, results_name
+from simulation import Simulation, default_params, int_params, engine_version
+
+# The default location of the cache and its default size bound.
+default_cache_path = Path("Simulations") / "cache"
+default_max_bytes = 2 * 2 ** 30
+
+# Name of the file describing an entry, its modification time marks when the entry was last used.
+entry_name = "entry.json"
+
+
+def cache_key(params, seed=42, until=None, engine="async", generator="legacy", **options):
+    """
+    This function returns the cache key of a run: the SHA-256 of its inputs, and the inputs themselves. Of the
+    Simulation options only the engine and generator change the outcome of a run, the others (neighbour_search, debug,
+    profile) are accepted and left out of the key, so they share the cached entry.
+    """
+    # Numbers are normalised so 0 and 0.0 give the same key.
+    params = {name: int(val) if name in int_params else float(val)
+              for name, val in dict(default_params, **params).items()}
+    inputs = {"params": params,
+              "seed": seed,
+              "until": until,
+              "engine": engine,
+              "generator": generator,
+              "engine_version": engine_version}
+    text = json.dumps(inputs, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest(), inputs
+
+
+class ResultCache:
+    """
+    Directory of cached run results keyed by cache_key(), with least recently used eviction. Counts the runs it
+    found (hits) and had to simulate (misses). Entries used since the time keep_since (e.g. the start of a sweep) are
+    never evicted, so concurrent workers do not remove an entry another worker is still copying.
+    """
+
+    def __init__(self, path=default_cache_path, max_bytes=default_max_bytes, keep_since=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.keep_since = keep_since
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, key):
+        return self.path / key[:2] / key
+
+    def get(self, key):
+        """
+        This function returns the cached Results of a key, or None if it is not cached.
+        """
+        entry = self.entry_path(key)
+        if not (entry / entry_name).exists():
+            return None
+
+        # Mark the entry as used for the eviction order. Another process may have evicted it in the meantime.
+        try:
+            os.utime(entry / entry_name)
+        except FileNotFoundError:
+            return None
+        return Results(entry)
+
+    def put(self, key, inputs, sim):
+        """
+        This function stores the statistics of a finished simulation under a key and returns them as Results. The entry
+        is written to a temporary directory first and moved into place, so concurrent writers never expose a partial
+        entry.
+        """
+        entry = self.entry_path(key)
+        temporary = entry.with_name(f"{key}.{os.getpid()}.tmp")
+        shutil.rmtree(temporary, ignore_errors=True)
+
+        sim.save_statistics(temporary / results_name)
+        size = sum(file.stat().st_size for file in temporary.rglob("*") if file.is_file())
+        with open(temporary / entry_name, "w") as handle:
+            json.dump(dict(inputs, key=key, bytes=size, created=time.time()), handle, indent=2)
+
+        # Replace an existing entry, e.g. when the run was forced.
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(temporary, entry)
+        except OSError:
+            # Another process stored the same run in the meantime, the results are the same.
+            shutil.rmtree(temporary, ignore_errors=True)
+
+        self.evict(keep=entry)
+        return Results(entry)
+
+    def entries(self):
+        """
+        This function returns the (last used time, size in bytes, path) of every entry.
+        """
+        entries = []
+        for entry_file in self.path.glob(f"*/*/{entry_name}"):
+            try:
+                with open(entry_file) as handle:
+                    size = json.load(handle)["bytes"]
+                entries.append((entry_file.stat().st_mtime, size, entry_file.parent))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def size(self):
+        """
+        This function returns the total size of the cached results in bytes.
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        This function removes the least recently used entries until the cache fits in max_bytes, except the entry in
+        "keep" (the one just stored) and the entries used since keep_since. Returns the number of entries removed.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        removed = 0
+        for used, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry == keep or (self.keep_since is not None and used >= self.keep_since):
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def run(self, params, seed=42, until=None, force=False, engine="async", generator="legacy", **overrides):
+        """
+        This function returns the Results of a run, simulating it only if it is not cached yet or "force" is set.
+        Keyword arguments that are model parameters override the parameters, like for Simulation; the others are
+        passed on to Simulation as options, e.g. neighbour_search.
+        """
+        options = {name: val for name, val in overrides.items() if name not in default_params}
+        params = dict(params, **{name: val for name, val in overrides.items() if name in default_params})
+        key, inputs = cache_key(params, seed, until, engine, generator, **options)
+
+        if not force:
+            results = self.get(key)
+            if results is not None:
+                self.hits += 1
+                return results
+
+        self.misses += 1
+        sim = Simulation(params, seed=seed, engine=engine, generator=generator, **options)
+        sim.run(until=until)
+        return self.put(key, inputs, sim)
@@ -0,0 +1,468 @@
+"""
+Parallel calibration of the virus parameters
+
+Fits max_infection_rate, case_fatality_rate and the recovery and carrier period ranges to target summary statistics,
+such as the share of the infected who die, with a population based approximate Bayesian computation (ABC-SMC without
+importance weights). Every generation proposes a batch of candidate parameter sets, runs replicates of each with a
+fixed set of seeds across a pool of worker processes, and keeps the candidates whose mean summary statistics are
+closest to the targets. The next generation perturbs the kept candidates, so the tolerance shrinks from generation to
+generation.
+
+Candidates are screened on their first replicates: those that are already far worse than the current tolerance are
+dropped without running the rest. The summary statistics of every run are cached under the cache key of the run (see
+cache.py), so a calibration can be extended or rerun with other targets without simulating the same runs again.
+
+Example, fitting the Marburg periods and rates so 88% of the infected die and 30% of the population is infected:
+    python calibration.py --virus marburg --target fatality_share=0.88 --target attack_rate=0.3 --workers 8
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from cache import cache_key
+from results_io import Results
+from simulation import Simulation, default_params, int_params, virus_dict, engines, generators
+from sweep import parse_value, task_seeds
+
+# The default location of the cache of summary statistics.
+default_cache_path = Path("Simulations") / "calibration.jsonl"
+
+# The parameters fitted by default and the range their candidates are drawn from.
+default_priors = {"max_infection_rate": (0.05, 1.0),
+                  "case_fatality_rate": (0.001, 0.95),
+                  "min_recovery_period": (2, 30),
+                  "max_recovery_period": (2, 60),
+                  "min_carrier_period": (1, 10),
+                  "max_carrier_period": (1, 20)}
+
+# The summary statistics of a run that can be used as targets.
+summary_names = ("attack_rate", "fatality_share", "peak_day", "peak_share", "days", "final_r0")
+
+
+def summary_statistics(series, pop_init):
+    """
+    This function returns the summary statistics of a run from its time series: the infections per agent of the
+    initial population (attack_rate, above 1 when immune agents are reinfected), the share of the infections that
+    ended in death (fatality_share), the day and size (as a share of the population) of the peak of the daily
+    infections, the duration in days and the final basic reproduction number.
+    """
+    daily_infected = np.asarray(series["infected_ts"])
+    total_infected = float(np.asarray(series["total_infected_ts"])[-1])
+    total_casualties = float(np.asarray(series["total_casualty_ts"])[-1])
+    reproduction = np.asarray(series["basic_reproduction_number_ts"])
+    return {"attack_rate": total_infected / pop_init,
+            "fatality_share": total_casualties / total_infected if total_infected > 0 else 0.0,
+            "peak_day": int(daily_infected.argmax()),
+            "peak_share": float(daily_infected.max()) / pop_init,
+            "days": len(daily_infected) - 1,
+            "final_r0": float(reproduction[-1])}
+
+
+def run_summary_statistics(run_path):
+    """
+    This function returns the summary statistics of a saved run, e.g. to use an observed run as the targets.
+    """
+    results = Results(run_path)
+    return summary_statistics(results, dict(default_params, **results.params)["pop_init"])
+
+
+def evaluate_replicate(task):
+    """
+    This function runs one replicate of a candidate and returns its summary statistics. It runs in the worker
+    processes.
+    """
+    params, seed, until, options = task
+    sim = Simulation(params, seed=seed, **options)
+    sim.run(until=until)
+    series = {"infected_ts": sim.infected_ts,
+              "total_infected_ts": sim.total_infected_ts,
+              "total_casualty_ts": sim.total_casualty_ts,
+              "basic_reproduction_number_ts": sim.basic_reproduction_number_ts}
+    return summary_statistics(series, sim.pop_init)
+
+
+def distance(summaries, targets):
+    """
+    This function returns the distance between the mean summary statistics of the replicates of a candidate and the
+    targets: the root mean square of the errors relative to the targets (absolute errors for targets of 0).
+    """
+    errors = []
+    for name, target in targets.items():
+        value = np.mean([summary[name] for summary in summaries])
+        errors.append((value - target) / (abs(target) if target != 0 else 1.0))
+    return math.sqrt(np.mean(np.square(errors)))
+
+
+# The pairs of parameters whose minimum can not be above their maximum.
+period_ranges = (("min_recovery_period", "max_recovery_period"), ("min_carrier_period", "max_carrier_period"))
+
+# The number of proposals drawn per candidate before giving up on drawing valid candidates.
+max_attempts = 1000
+
+
+def is_valid(candidate):
+    """
+    This function returns True if the minimum periods of a candidate are not above its maximum periods.
+    """
+    return all(candidate[low] <= candidate[high] for low, high in period_ranges)
+
+
+def check_priors(params, priors):
+    """
+    This function raises a ValueError if a prior range is empty, or if the prior ranges and fixed values of a minimum
+    and maximum period can never give a valid candidate.
+    """
+    for name, (low, high) in priors.items():
+        if low > high:
+            raise ValueError(f"The range of {name} is empty: {low}:{high}")
+
+    for minimum, maximum in period_ranges:
+        lowest = priors[minimum][0] if minimum in priors else params[minimum]
+        highest = priors[maximum][1] if maximum in priors else params[maximum]
+        if round(lowest) > round(highest):
+            raise ValueError(f"{minimum} is at least {lowest} but {maximum} is at most {highest}, "
+                             f"so no candidate is valid")
+
+
+class SummaryCache:
+    """
+    The summary statistics of every run evaluated so far, keyed by the cache key of the run and appended to a JSON
+    lines file, so they are kept across calibrations. Counts the runs it found (hits) and had to simulate (misses).
+    """
+
+    def __init__(self, path=default_cache_path):
+        self.path = Path(path) if path is not None else None
+        self.summaries = {}
+        self.hits = 0
+        self.misses = 0
+
+        if self.path is not None and self.path.exists():
+            with open(self.path) as handle:
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                        self.summaries[entry["key"]] = entry["summary"]
+                    except (ValueError, KeyError):
+                        # A line cut short by an interrupted calibration.
+                        continue
+
+    def evaluate(self, executor, tasks, options, workers=None):
+        """
+        This function returns the summary statistics of every (params, seed, until) task, running the ones that are
+        not cached yet on the executor.
+        """
+        keys = [cache_key(params, seed, until, **options)[0] for params, seed, until in tasks]
+
+        missing = {}
+        for key, task in zip(keys, tasks):
+            if key not in self.summaries and key not in missing:
+                missing[key] = task
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        # Spread the runs across the pool in chunks, to keep the overhead per run low for small populations.
+        chunksize = max(1, len(missing) // (4 * (workers or os.cpu_count())))
+        summaries = executor.map(evaluate_replicate, [task + (options,) for task in missing.values()],
+                                 chunksize=chunksize)
+
+        new = dict(zip(missing, summaries))
+        self.summaries.update(new)
+        if self.path is not None and new:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as handle:
+                for key, summary in new.items():
+                    handle.write(json.dumps({"key": key, "summary": summary}) + "\n")
+
+        return [self.summaries[key] for key in keys]
+
+
+class Calibration:
+    """
+    Population based ABC calibration of the parameters in "priors", a dictionary of parameter name to (low, high)
+    range, against the "targets", a dictionary of summary statistic name to value. The other parameters are taken
+    from "params".
+    """
+
+    def __init__(self, params, targets, priors=None, replicates=4, seed=42, until=365, cache_path=default_cache_path,
+                 **options):
+        unknown = [name for name in targets if name not in summary_names]
+        if unknown:
+            raise ValueError(f"Unknown summary statistics {unknown}, the targets must be in {summary_names}")
+        priors = dict(default_priors if priors is None else priors)
+        unknown = [name for name in priors if name not in default_params]
+        if unknown:
+            raise ValueError(f"Unknown parameters {unknown}")
+
+        self.params = dict(default_params, **params)
+        check_priors(self.params, priors)
+        self.targets = targets
+        self.priors = priors
+        self.replicates = replicates
+        self.seed = seed
+        self.until = until
+        self.options = options
+        self.rng = np.random.default_rng(seed)
+
+        # Every candidate is run with the same seeds, so differences between candidates are not down to chance.
+        self.seeds = task_seeds(seed, replicates)
+        self.cache = SummaryCache(cache_path)
+        self.workers = None
+
+    def candidate(self, values):
+        """
+        This function returns the full parameter set of a candidate from the values of the fitted parameters, rounding
+        the integer parameters.
+        """
+        candidate = dict(self.params)
+        for name, val in zip(self.priors, values):
+            candidate[name] = int(round(val)) if name in int_params else float(val)
+        return candidate
+
+    def sample_prior(self, n):
+        """
+        This function draws n valid candidates uniformly from the prior ranges.
+        """
+        low, high = np.array(list(self.priors.values()), dtype=float).T
+        return self.draw(lambda: self.rng.uniform(low, high), n)
+
+    def perturb(self, accepted, n):
+        """
+        This function draws n valid candidates by perturbing randomly chosen accepted candidates with a Gaussian
+        kernel of twice the variance of the accepted candidates, reflected into the prior ranges.
+        """
+        low, high = np.array(list(self.priors.values()), dtype=float).T
+        values = np.array([[particle["params"][name] for name in self.priors] for particle in accepted], dtype=float)
+        # A floor on the kernel width keeps a converged parameter exploring its neighbourhood.
+        scale = np.maximum(np.sqrt(2) * values.std(axis=0), 0.01 * (high - low))
+
+        def propose():
+            proposal = values[self.rng.integers(len(values))] + self.rng.normal(0, scale)
+            proposal = np.where(proposal < low, 2 * low - proposal, proposal)
+            proposal = np.where(proposal > high, 2 * high - proposal, proposal)
+            return np.clip(proposal, low, high)
+
+        return self.draw(propose, n)
+
+    def draw(self, propose, n):
+        """
+        This function returns n valid candidates from the values returned by "propose", rejecting invalid ones. It
+        raises a ValueError if valid candidates are too rare to draw.
+        """
+        candidates = []
+        for _ in range(max_attempts * n):
+            candidate = self.candidate(propose())
+            if is_valid(candidate):
+                candidates.append(candidate)
+                if len(candidates) == n:
+                    return candidates
+
+        raise ValueError(f"Fewer than 1 in {max_attempts} candidates have the minimum periods "
+                         f"{', '.join(low for low, _ in period_ranges)} at most the maximum periods, "
+                         f"widen the ranges of the periods")
+
+    def evaluate(self, executor, candidates, screen=1, threshold=math.inf):
+        """
+        This function runs the replicates of the candidates and returns a particle per candidate with its parameters,
+        mean summary statistics and distance. Every candidate is first run with the first "screen" seeds; the ones
+        whose distance is then above "threshold" are not run any further and are marked as screened.
+        """
+        stages = [self.seeds[:screen], self.seeds[screen:]] if 0 < screen < self.replicates else [self.seeds]
+
+        summaries = [[] for _ in candidates]
+        alive = list(range(len(candidates)))
+        for stage, seeds in enumerate(stages):
+            tasks = [(candidates[i], seed, self.until) for i in alive for seed in seeds]
+            results = iter(self.cache.evaluate(executor, tasks, self.options, self.workers))
+            for i in alive:
+                summaries[i].extend(next(results) for _ in seeds)
+
+            # Drop the clearly bad candidates before running their remaining replicates.
+            if stage < len(stages) - 1:
+                alive = [i for i in alive if distance(summaries[i], self.targets) <= threshold]
+
+        particles = []
+        for i, candidate in enumerate(candidates):
+            mean = {name: float(np.mean([summary[name] for summary in summaries[i]])) for name in summary_names}
+            particles.append({"params": candidate,
+                              "summary": mean,
+                              "replicates": len(summaries[i]),
+                              "distance": distance(summaries[i], self.targets),
+                              "screened": len(summaries[i]) < self.replicates})
+        return particles
+
+    def run(self, particles=64, generations=5, keep=0.25, screen=1, screen_factor=2.0, tolerance=None, workers=None):
+        """
+        This function runs the calibration: "generations" batches of "particles" candidates, of which the best "keep"
+        share of all the fully evaluated candidates so far are accepted. Candidates whose distance on their first
+        "screen" replicates is above screen_factor times the current tolerance are dropped early. The calibration stops
+        early once the tolerance, the distance of the worst accepted candidate, is at most "tolerance". Returns the
+        result as a dictionary.
+        """
+        self.workers = workers
+        n_keep = max(2, int(round(keep * particles)))
+        accepted = []
+        history = []
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for generation in range(generations):
+                start = time.perf_counter()
+                if accepted:
+                    candidates = self.perturb(accepted, particles)
+                    threshold = screen_factor * accepted[-1]["distance"]
+                else:
+                    candidates = self.sample_prior(particles)
+                    threshold = math.inf
+
+                evaluated = self.evaluate(executor, candidates, screen, threshold)
+                complete = [particle for particle in evaluated if not particle["screened"]]
+                accepted = sorted(accepted + complete, key=lambda particle: particle["distance"])[:n_keep]
+
+                history.append({"generation": generation,
+                                "tolerance": accepted[-1]["distance"],
+                                "best": accepted[0]["distance"],
+                                "screened": len(evaluated) - len(complete),
+                                "runs": self.cache.misses,
+                                "cached": self.cache.hits,
+                                "seconds": time.perf_counter() - start})
+                print(f"Generation {generation}: tolerance {history[-1]['tolerance']:.4f}, "
+                      f"best {history[-1]['best']:.4f}, {history[-1]['screened']} screened "
+                      f"({history[-1]['seconds']:.1f}s)")
+
+                if tolerance is not None and accepted[-1]["distance"] <= tolerance:
+                    break
+
+        values = np.array([[particle["params"][name] for name in self.priors] for particle in accepted], dtype=float)
+        return {"targets": self.targets,
+                "priors": self.priors,
+                "params": self.params,
+                "replicates": self.replicates,
+                "seed": self.seed,
+                "until": self.until,
+                "options": self.options,
+                "best": {name: accepted[0]["params"][name] for name in self.priors},
+                "distance": accepted[0]["distance"],
+                "mean": dict(zip(self.priors, values.mean(axis=0).tolist())),
+                "std": dict(zip(self.priors, values.std(axis=0).tolist())),
+                "accepted": accepted,
+                "history": history}
+
+
+def calibrate(params, targets, priors=None, particles=64, generations=5, keep=0.25, replicates=4, screen=1,
+              screen_factor=2.0, tolerance=None, seed=42, until=365, workers=None, cache_path=default_cache_path,
+              **options):
+    """
+    This function calibrates the parameters in "priors" (by default those in default_priors) against the target
+    summary statistics and returns the result, see Calibration.run(). Keyword arguments are passed on to Simulation,
+    e.g. engine="sync".
+    """
+    calibration = Calibration(params, targets, priors, replicates=replicates, seed=seed, until=until,
+                              cache_path=cache_path, **options)
+    return calibration.run(particles=particles, generations=generations, keep=keep, screen=screen,
+                           screen_factor=screen_factor, tolerance=tolerance, workers=workers)
+
+
+def parse_assignments(specs):
+    """
+    This function parses specifications of the form name=value into a dictionary.
+    """
+    assignments = {}
+    for spec in specs:
+        name, _, val = spec.partition("=")
+        assignments[name.strip()] = parse_value(val)
+    return assignments
+
+
+def parse_priors(specs):
+    """
+    This function parses prior ranges of the form name=low:high into a dictionary of parameter name to (low, high).
+    """
+    priors = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        low, high = (parse_value(val) for val in values.split(":"))
+        priors[name.strip()] = (low, high)
+    return priors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the virus parameters of the simulation to target statistics.")
+    parser.add_argument("--virus", default="default",
+                        help="virus to take the starting parameters from: " + ", ".join(virus_dict))
+    parser.add_argument("--target", action="append", default=[], metavar="NAME=VALUE",
+                        help="target summary statistic, one of " + ", ".join(summary_names) + ". Can be repeated")
+    parser.add_argument("--target-run", type=Path, default=None,
+                        help="vac_rate_X directory of a saved run whose summary statistics are used as the targets "
+                             "not given with --target")
+    parser.add_argument("--fit", action="append", default=[], metavar="NAME=LOW:HIGH",
+                        help="parameter to fit and the range of its candidates. Can be repeated. Defaults to "
+                             + ", ".join(f"{name}={low}:{high}" for name, (low, high) in default_priors.items()))
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="fixed parameter value, e.g. pop_init=1000. Can be repeated")
+    parser.add_argument("--particles", type=int, default=64, help="candidates per generation")
+    parser.add_argument("--generations", type=int, default=5, help="maximum number of generations")
+    parser.add_argument("--keep", type=float, default=0.25, help="share of the candidates that are accepted")
+    parser.add_argument("--replicates", type=int, default=4, help="replicates per candidate")
+    parser.add_argument("--screen", type=int, default=1, help="replicates run before screening a candidate")
+    parser.add_argument("--screen-factor", type=float, default=2.0,
+                        help="candidates further than this many times the tolerance after screening are dropped")
+    parser.add_argument("--tolerance", type=float, default=None, help="stop once the tolerance is at most this")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42, help="base seed for the replicate seeds and the proposals")
+    parser.add_argument("--until", type=int, default=365, help="maximum number of days to simulate")
+    parser.add_argument("--engine", choices=engines, default="async", help="updating scheme of the simulation")
+    parser.add_argument("--generator", choices=generators, default="legacy", help="random number generator")
+    parser.add_argument("--cache", type=Path, default=default_cache_path,
+                        help=f"cache of the summary statistics (default: {default_cache_path})")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or store the summary statistics")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="result file (default: Simulations/<virus>_calibration_<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    virus_name = args.virus.strip().lower()
+    if virus_name != "default" and virus_name not in virus_dict:
+        parser.error(f"unknown virus {args.virus!r}")
+    params = dict(default_params, **virus_dict.get(virus_name, {}), **parse_assignments(args.set))
+
+    # The duration and final reproduction number of a single run are too noisy to be used as targets by default.
+    targets = {}
+    if args.target_run is not None:
+        summary = run_summary_statistics(args.target_run)
+        targets = {name: summary[name] for name in ("attack_rate", "fatality_share", "peak_day")}
+    targets.update(parse_assignments(args.target))
+    if not targets:
+        parser.error("no targets given, use --target or --target-run")
+
+    output_path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        output_path = Path.cwd() / "Simulations" / f"{virus_name}_calibration_{timestamp}.json"
+
+    try:
+        result = calibrate(params, targets, parse_priors(args.fit) or None, particles=args.particles,
+                           generations=args.generations, keep=args.keep, replicates=args.replicates,
+                           screen=args.screen, screen_factor=args.screen_factor, tolerance=args.tolerance,
+                           seed=args.seed, until=args.until, workers=args.workers,
+                           cache_path=None if args.no_cache else args.cache, engine=args.engine,
+                           generator=args.generator)
+    except ValueError as error:
+        parser.error(str(error))
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as handle:
+        json.dump(result, handle, indent=2)
+
+    # Print the fitted parameters as an entry for virus_dict.
+    print(f"Distance {result['distance']:.4f}, results in {output_path}")
+    print(json.dumps({virus_name: result["best"]}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
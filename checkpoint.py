@@ -0,0 +1,171 @@
+"""
+Checkpoint, restore and fork of simulation state
+
+A checkpoint holds everything needed to continue a run exactly where it stopped: the parameters and options, the live
+agent columns, the random number generator state, the time series and counters, the running reproduction number
+totals and the transmission log. It is a single compressed .npz file. The grid index and the state index are rebuilt
+from the agents on restore; neither affects which agents are picked, so a restored run follows the same trajectory as
+the original.
+
+With the event engine the pending disease events and the event clock are saved as well.
+
+A checkpoint can also be forked into branches with different parameters, so an intervention study shares one warm-up.
+
+Example, vaccinating until 30% of the agents are immune or halving the infection rate at day 30:
+    sim = Simulation(virus_dict["covid"], pop_init=10000)
+    sim.run(until=30)
+    save_checkpoint(sim, "day30.npz")
+    branches = fork("day30.npz", [{"vac_rate": 0.3}, {"max_infection_rate": 0.45}])
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from population import Population, column_dtypes
+from scheduler import EventScheduler
+from simulation import Simulation
+from transmission import TransmissionLog, ReproductionTracker, log_dtypes
+
+checkpoint_version = 2
+
+# The time series of the simulation.
+series_names = ("infected_ts", "total_infected_ts", "casualty_ts", "total_casualty_ts", "basic_reproduction_number_ts")
+
+# The counters of the simulation.
+counter_names = ("time", "clock", "total_infected", "total_casualties", "daily_infected", "daily_casualties")
+
+
+def save_checkpoint(sim, path):
+    """
+    This function writes the full state of a simulation to the checkpoint file "path".
+    """
+    pop = sim.population
+
+    meta = {"version": checkpoint_version,
+            "params": sim.params,
+            "seed": sim.seed,
+            "engine": sim.engine,
+            "generator": sim.generator,
+            "neighbour_search": sim.neighbour_search,
+            "debug": sim.debug,
+            "output_path": str(sim.output_path) if sim.output_path is not None else None,
+            "current_output_path": str(sim.current_output_path) if sim.current_output_path is not None else None,
+            "capacity": pop.capacity,
+            "counters": {name: getattr(sim, name) for name in counter_names},
+            "reproduction": [sim.reproduction.secondary_cases, sim.reproduction.cases]}
+    if sim.scheduler is not None:
+        meta["event_seq"] = sim.scheduler.seq
+
+    # The legacy generator state holds its key array, the block generator state the unused part of its block.
+    if sim.generator == "legacy":
+        rng_name, rng_array, pos, has_gauss, cached_gaussian = sim.rng.get_state()
+        meta["rng"] = [rng_name, pos, has_gauss, cached_gaussian]
+    else:
+        meta["rng"], rng_array = sim.rng.get_state()
+
+    arrays = {"meta": np.array(json.dumps(meta)),
+              "rng_array": rng_array,
+              "new_infections": np.array(sim.new_infections, dtype=np.int64)}
+    for name in column_dtypes:
+        arrays[f"agents/{name}"] = pop.live(name)
+    for name in series_names:
+        arrays[f"series/{name}"] = np.asarray(getattr(sim, name), dtype=np.float64)
+    for name, values in sim.transmissions.columns().items():
+        arrays[f"transmissions/{name}"] = values
+    if sim.scheduler is not None:
+        for name, values in sim.scheduler.columns().items():
+            arrays[f"events/{name}"] = values
+
+    with open(path, "wb") as handle:
+        np.savez_compressed(handle, **arrays)
+    return Path(path)
+
+
+def load_checkpoint(path, output_path=None, **overrides):
+    """
+    This function restores a simulation from the checkpoint file "path". Parameters given as keyword arguments are
+    changed on the restored simulation (see fork()), and output_path redirects its output.
+    """
+    with np.load(path) as checkpoint:
+        meta = json.loads(str(checkpoint["meta"]))
+        if meta["version"] != checkpoint_version:
+            raise ValueError(f"Unsupported checkpoint version {meta['version']} in {path}")
+
+        sim = Simulation(meta["params"], seed=meta["seed"], output_path=meta["output_path"],
+                         neighbour_search=meta["neighbour_search"], engine=meta["engine"], debug=meta["debug"],
+                         generator=meta["generator"], initialize=False)
+
+        # The live agents, with the id to row mapping and state index rebuilt from them.
+        pop = Population(meta["capacity"])
+        pop.n = len(checkpoint["agents/ids"])
+        for name in column_dtypes:
+            getattr(pop, name)[:pop.n] = checkpoint[f"agents/{name}"]
+        pop.row_of[:] = -1
+        pop.row_of[pop.live("ids")] = np.arange(pop.n)
+        pop.recount()
+        sim.population = pop
+
+        # The random number generator continues from the same point.
+        sim.seed_rng(sim.seed)
+        if sim.generator == "legacy":
+            rng_name, pos, has_gauss, cached_gaussian = meta["rng"]
+            sim.rng.set_state((rng_name, checkpoint["rng_array"], pos, has_gauss, cached_gaussian))
+        else:
+            sim.rng.set_state(meta["rng"], checkpoint["rng_array"])
+
+        for name, val in meta["counters"].items():
+            setattr(sim, name, val)
+        for name in series_names:
+            series = checkpoint[f"series/{name}"]
+            setattr(sim, name, series.tolist() if name == "basic_reproduction_number_ts" else
+                    series.astype(np.int64).tolist())
+
+        sim.reproduction = ReproductionTracker()
+        sim.reproduction.secondary_cases, sim.reproduction.cases = meta["reproduction"]
+        sim.new_infections = checkpoint["new_infections"].tolist()
+        sim.transmissions = TransmissionLog.from_columns({name: checkpoint[f"transmissions/{name}"]
+                                                          for name in log_dtypes})
+        if "event_seq" in meta:
+            sim.scheduler = EventScheduler.from_columns({name: checkpoint[f"events/{name}"]
+                                                         for name in ("time", "seq", "kind", "agent")},
+                                                        meta["event_seq"])
+
+    current_output_path = meta["current_output_path"]
+    sim.current_output_path = Path(current_output_path) if current_output_path is not None else None
+    if output_path is not None:
+        sim.output_path = Path(output_path)
+        sim.current_output_path = sim.output_path / f"vac_rate_{str(overrides.get('vac_rate', sim.vac_rate))}"
+
+    sim.build_index()
+
+    # A new vaccination rate is applied as a vaccination campaign that tops up the immunity of the live agents to it,
+    # the other parameters take effect from now on.
+    vac_rate = overrides.pop("vac_rate", None)
+    if overrides:
+        sim.set_params(**overrides)
+    if vac_rate is not None:
+        sim.set_params(vac_rate=vac_rate)
+        sim.vaccinate(vac_rate)
+
+    return sim
+
+
+def fork(path, branches, seeds=None, output_path=None):
+    """
+    This function restores one simulation per branch from the checkpoint file "path", each with the parameter changes
+    in its dictionary of "branches". A "vac_rate" change is a vaccination campaign: susceptible agents are vaccinated
+    until "vac_rate"% of the live agents are immune (see Simulation.vaccinate()), which does nothing if as many are
+    immune already. By default the branches continue from the same random number generator state, so they differ only
+    through their parameters; "seeds" gives every branch its own generator instead. With output_path, every branch
+    writes to its own branch_<i> directory inside it.
+    """
+    sims = []
+    for i, changes in enumerate(branches):
+        branch_path = Path(output_path) / f"branch_{i}" if output_path is not None else None
+        sim = load_checkpoint(path, output_path=branch_path, **changes)
+        if seeds is not None:
+            sim.seed_rng(seeds[i])
+        sims.append(sim)
+    return sims
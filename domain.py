@@ -0,0 +1,697 @@
+"""
+Domain decomposed multi-process engine
+
+For populations of millions of agents the unit square is split into a grid of tiles, each owned by a worker process
+that holds the agents inside its tile in shared memory. Every time step follows the rules of the synchronous engine (see
+sync_engine.py) in four phases, separated by barriers between the workers:
+
+1. every worker moves its agents and puts the ones that left its tile in its outbox,
+2. every worker takes the agents that entered its tile from the outboxes of the neighbouring tiles and publishes its
+   halo: the rows of its infectious agents within cd of a neighbouring tile,
+3. every worker exposes its susceptible agents to the nearest infectious agent among its own and those in the halos of
+   the neighbouring tiles, posting the secondary infections of the agents of other tiles as credits for their owner,
+4. every worker applies the credits for its agents and progresses the disease of its agents.
+
+Workers only read the outboxes, halos and credits of their neighbours, so the tiles are at least max(cd, speed) wide.
+After every step the main process reduces the daily infections and casualties, the sums behind the basic reproduction
+number estimate and the number of infectious agents of the tiles. Every tile draws from its own random number stream,
+so a run is statistically equivalent to, but not the same as, a run of the synchronous engine with the same seed.
+
+Example, 4 million agents on every core:
+    with TiledSimulation(virus_dict["covid"], pop_init=4000000, infected_init=100) as sim:
+        sim.run(until=200)
+        sim.total_casualty_ts[-1]
+"""
+
+import math
+import os
+import traceback
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from threading import BrokenBarrierError
+
+import numpy as np
+
+from population import column_dtypes, SUSCEPTIBLE, CARRIER, INFECTED, IMMUNE
+from simulation import Simulation
+from sweep import task_seeds
+from sync_engine import nearest_neighbours
+from transmission import TransmissionLog, ReproductionTracker, log_dtypes
+
+# Commands from the main process to the workers.
+step_command = 0
+log_command = 1
+stop_command = 2
+
+# The counters every tile reports after a step, summed over the tiles by the main process.
+counter_names = ("daily_infected", "daily_casualties", "secondary_cases", "cases", "infectious", "n")
+
+# Positions in the "counts" array of a tile: live agents, agents in the outbox, halo rows and credits.
+live_count, outbox_count, halo_count, credit_count = range(4)
+
+
+class SharedArrays:
+    """
+    Named NumPy arrays laid out in a single shared memory block. The process that creates the block unlinks it when it
+    is closed, other processes attach to it by name.
+    """
+
+    def __init__(self, fields, name=None):
+        offsets = {}
+        size = 0
+        for field, (dtype, shape) in fields.items():
+            offsets[field] = size
+            # Keep every array 8 byte aligned.
+            size += -(-np.dtype(dtype).itemsize * int(np.prod(shape)) // 8) * 8
+
+        # The workers share the resource tracker of the main process, which tracks each block once however often it
+        # is attached to.
+        self.created = name is None
+        self.memory = SharedMemory(name=name, create=self.created, size=max(size, 8) if self.created else 0)
+
+        self.name = self.memory.name
+        self.arrays = {field: np.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=offsets[field])
+                       for field, (dtype, shape) in fields.items()}
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def close(self):
+        # The arrays have to be released before the memory can be closed.
+        self.arrays = {}
+        self.memory.close()
+        if self.created:
+            self.memory.unlink()
+
+
+def tile_fields(capacity):
+    """
+    This function returns the layout of the shared memory of a tile holding up to "capacity" agents: the agent columns,
+    an outbox with the same columns, the halo rows, the credits as (tile, row) pairs and the counts of each.
+    """
+    fields = {name: (dtype, (capacity,)) for name, dtype in column_dtypes.items()}
+    fields.update({"outbox_" + name: (dtype, (capacity,)) for name, dtype in column_dtypes.items()})
+    fields["halo"] = (np.int64, (capacity,))
+    fields["credits"] = (np.int64, (capacity, 2))
+    fields["counts"] = (np.int64, (4,))
+    return fields
+
+
+def control_fields(tiles):
+    """
+    This function returns the layout of the shared memory of the main process: the command and the counters of every
+    tile.
+    """
+    return {"command": (np.int64, (1,)),
+            "counters": (np.int64, (tiles, len(counter_names)))}
+
+
+def tile_grid(workers, min_width):
+    """
+    This function returns the (columns, rows) of the grid of at most "workers" tiles, all at least min_width wide, with
+    the most tiles and among those the squarest.
+    """
+    max_side = max(1, int(1 / min_width + 1e-9))
+    best = (1, 1)
+    for nx in range(1, min(workers, max_side) + 1):
+        ny = min(workers // nx, max_side)
+        if (nx * ny, -abs(nx - ny)) > (best[0] * best[1], -abs(best[0] - best[1])):
+            best = (nx, ny)
+    return best
+
+
+def tile_of(grid, x, y):
+    """
+    This function returns the tile that holds every position.
+    """
+    nx, ny = grid
+    ix = np.minimum((x * nx).astype(np.int64), nx - 1)
+    iy = np.minimum((y * ny).astype(np.int64), ny - 1)
+    return ix * ny + iy
+
+
+def tile_neighbours(grid, k):
+    """
+    This function returns the tiles next to (including diagonally) tile k.
+    """
+    nx, ny = grid
+    ix, iy = divmod(k, ny)
+    return [jx * ny + jy for jx in range(ix - 1, ix + 2) for jy in range(iy - 1, iy + 2)
+            if 0 <= jx < nx and 0 <= jy < ny and (jx, jy) != (ix, iy)]
+
+
+class TileWorker:
+    """
+    The agents of one tile and the steps of the synchronous engine on them, run in a worker process. The parameters and
+    derived tables come from a Simulation that is not initialised, whose random number generator is the stream of the
+    tile.
+    """
+
+    def __init__(self, k, grid, params, seed, generator, names, capacity):
+        self.k = k
+        self.grid = grid
+        self.capacity = capacity
+        self.neighbours = tile_neighbours(grid, k)
+        self.time = 0
+
+        self.sim = Simulation(params, engine="sync", generator=generator, initialize=False)
+        self.sim.seed_rng(seed)
+
+        # The shared memory of this tile and of the neighbouring tiles.
+        self.tiles = {j: SharedArrays(tile_fields(capacity), names[j]) for j in [k] + self.neighbours}
+        self.tile = self.tiles[k]
+        self.n = 0
+
+        self.transmissions = TransmissionLog()
+        self.reproduction = ReproductionTracker()
+        self.daily_infected = 0
+        self.daily_casualties = 0
+
+    def close(self):
+        for tile in self.tiles.values():
+            tile.close()
+
+    def live(self, name):
+        """
+        This function returns a view on the live rows of a column of the tile.
+        """
+        return self.tile[name][:self.n]
+
+    def gather(self, name, owners, rows):
+        """
+        This function reads a column for agents given by the tile that owns them and their row in it.
+        """
+        values = np.empty(len(rows), dtype=column_dtypes[name])
+        for j, tile in self.tiles.items():
+            owned = owners == j
+            values[owned] = tile[name][rows[owned]]
+        return values
+
+    def compact(self, keep):
+        """
+        This function removes every live agent whose entry in the boolean mask "keep" is False, preserving the order of
+        the remaining agents.
+        """
+        n = int(np.count_nonzero(keep))
+        for name in column_dtypes:
+            column = self.tile[name]
+            column[:n] = column[:self.n][keep]
+        self.n = n
+
+    def initialize(self, first_id, n_susceptible, first_infected_id, n_infected):
+        """
+        This function spawns the agents of the tile at random positions inside it, as in Simulation.initialize(): the
+        susceptible agents with ids from first_id and the infected agents with ids from first_infected_id.
+        """
+        sim = self.sim
+        rng = sim.rng
+        n = n_susceptible + n_infected
+        if n > self.capacity:
+            raise RuntimeError(f"Tile {self.k} is full ({self.capacity} agents), use a larger capacity_factor")
+
+        self.n = n
+        for name in column_dtypes:
+            self.live(name)[:] = 0
+        self.live("ids")[:] = np.concatenate([np.arange(first_id, first_id + n_susceptible),
+                                              np.arange(first_infected_id, first_infected_id + n_infected)])
+
+        # randomly assign immune to "vac_rate"% of agents.
+        self.live("immune")[:] = rng.random_sample(n) < sim.vac_rate
+
+        infected = np.arange(n_susceptible, n)
+        self.tile["state"][infected] = INFECTED
+        self.tile["prior_infection"][infected] = True
+        self.tile["new_infection"][infected] = True
+        self.tile["rec_time"][infected] = rng.uniform(sim.rec_time_range[0], sim.rec_time_range[1], n_infected)
+        self.transmissions.extend(0, -1, self.tile["ids"][infected], True)
+
+        # Assign a random position inside the tile to the agents.
+        nx, ny = self.grid
+        ix, iy = divmod(self.k, ny)
+        self.live("x")[:] = (ix + rng.random_sample(n)) / nx
+        self.live("y")[:] = (iy + rng.random_sample(n)) / ny
+        self.tile["counts"][live_count] = self.n
+
+    def move(self):
+        """
+        This function moves every agent of the tile and moves the agents that left the tile to its outbox.
+        """
+        sim = self.sim
+        n = self.n
+        x = self.live("x")
+        y = self.live("y")
+
+        # simulate random movement before agent interactions
+        x[:] = np.clip(x + sim.rng.uniform(-sim.speed, sim.speed, n), 0, 1)
+        y[:] = np.clip(y + sim.rng.uniform(-sim.speed, sim.speed, n), 0, 1)
+
+        leaving = tile_of(self.grid, x, y) != self.k
+        m = int(np.count_nonzero(leaving))
+        for name in column_dtypes:
+            self.tile["outbox_" + name][:m] = self.live(name)[leaving]
+        self.tile["counts"][outbox_count] = m
+        if m > 0:
+            self.compact(~leaving)
+
+    def immigrate(self):
+        """
+        This function takes the agents that entered the tile from the outboxes of the neighbouring tiles, then publishes
+        the halo of the tile.
+        """
+        for j in self.neighbours:
+            tile = self.tiles[j]
+            m = tile["counts"][outbox_count]
+            entering = np.flatnonzero(tile_of(self.grid, tile["outbox_x"][:m], tile["outbox_y"][:m]) == self.k)
+            if len(entering) == 0:
+                continue
+
+            if self.n + len(entering) > self.capacity:
+                raise RuntimeError(f"Tile {self.k} is full ({self.capacity} agents), use a larger capacity_factor")
+            for name in column_dtypes:
+                self.tile[name][self.n:self.n + len(entering)] = tile["outbox_" + name][entering]
+            self.n += len(entering)
+
+        # The infectious agents within cd of a side that borders another tile can infect the agents of that tile.
+        cd = self.sim.cd
+        nx, ny = self.grid
+        ix, iy = divmod(self.k, ny)
+        x = self.live("x")
+        y = self.live("y")
+        near = np.zeros(self.n, dtype=bool)
+        if ix > 0:
+            near |= x - ix / nx < cd
+        if ix < nx - 1:
+            near |= (ix + 1) / nx - x < cd
+        if iy > 0:
+            near |= y - iy / ny < cd
+        if iy < ny - 1:
+            near |= (iy + 1) / ny - y < cd
+
+        halo = np.flatnonzero(near & (self.live("state") != SUSCEPTIBLE))
+        self.tile["halo"][:len(halo)] = halo
+        self.tile["counts"][halo_count] = len(halo)
+        self.tile["counts"][live_count] = self.n
+
+    def infect(self):
+        """
+        This function exposes every susceptible agent of the tile to the nearest infectious agent of the tile or of the
+        halos of the neighbouring tiles, as in sync_engine.step().
+        """
+        sim = self.sim
+        rng = sim.rng
+        pop = self.tile
+        state = self.live("state")
+        immune = self.live("immune")
+        x = self.live("x")
+        y = self.live("y")
+
+        # The infectious agents that can be met, by the tile that owns them and their row in it.
+        susceptible = np.flatnonzero(state == SUSCEPTIBLE)
+        local = np.flatnonzero(state != SUSCEPTIBLE)
+        owners = [np.full(len(local), self.k)]
+        rows = [local]
+        for j in self.neighbours:
+            tile = self.tiles[j]
+            halo = tile["halo"][:tile["counts"][halo_count]]
+            owners.append(np.full(len(halo), j))
+            rows.append(halo)
+        owners = np.concatenate(owners)
+        rows = np.concatenate(rows)
+
+        # susceptible behaviour, each susceptible agent meets the closest infectious agent at the start of the step.
+        nearest, squared_distance = nearest_neighbours(x[susceptible], y[susceptible], self.gather("x", owners, rows),
+                                                       self.gather("y", owners, rows), sim.cd)
+        found = nearest >= 0
+        susceptible = susceptible[found]
+        source_owner = owners[nearest[found]]
+        source_row = rows[nearest[found]]
+        distance = np.sqrt(squared_distance[found])
+
+        # Scale the infection rate dependent on the distance between the agents, lowering it for immune agents and
+        # immune neighbours.
+        infection_rate = sim.max_infection_rate * (1 - distance / sim.cd)
+        infection_rate = np.where(immune[susceptible], infection_rate / 5, infection_rate)
+        infection_rate = np.where(self.gather("immune", source_owner, source_row), infection_rate / 5, infection_rate)
+
+        # Check which agents have got infected.
+        infected = (infection_rate > 0) & (rng.random_sample(len(susceptible)) < infection_rate)
+        new = susceptible[infected]
+        source_owner = source_owner[infected]
+        source_row = source_row[infected]
+
+        # Agents that were not previously infected count towards the secondary infections of their neighbour, directly
+        # for the agents of this tile and through a credit for the agents of other tiles.
+        first = ~pop["prior_infection"][new]
+        pop["prior_infection"][new[first]] = True
+        pop["new_infection"][new[first]] = True
+        own = source_owner == self.k
+        np.add.at(pop["no_infected"], source_row[first & own], 1)
+        credits = first & ~own
+        m = int(np.count_nonzero(credits))
+        pop["credits"][:m, 0] = source_owner[credits]
+        pop["credits"][:m, 1] = source_row[credits]
+        pop["counts"][credit_count] = m
+
+        # They count towards the estimate of the basic reproduction number if the neighbour is already counted.
+        counted = ((self.gather("state", source_owner[first], source_row[first]) == INFECTED)
+                   & ~self.gather("new_infection", source_owner[first], source_row[first]))
+        self.reproduction.add(np.count_nonzero(counted), 0)
+        self.transmissions.extend(self.time, self.gather("ids", source_owner, source_row), pop["ids"][new], first)
+
+        # Change the agents to carriers with a recovery time, carrier time and infected time.
+        state[new] = CARRIER
+        pop["rec_time"][new] = rng.uniform(sim.rec_time_range[0], sim.rec_time_range[1], len(new))
+        pop["carrier_time"][new] = rng.uniform(sim.carrier_time_range[0], sim.carrier_time_range[1], len(new))
+        pop["infected_time"][new] = 0
+
+        self.daily_infected = len(new)
+
+    def progress(self):
+        """
+        This function applies the credits of the neighbouring tiles for the agents of the tile and progresses the
+        disease of its agents, as in sync_engine.step().
+        """
+        sim = self.sim
+        pop = self.tile
+
+        for j in self.neighbours:
+            tile = self.tiles[j]
+            credits = tile["credits"][:tile["counts"][credit_count]]
+            np.add.at(pop["no_infected"], credits[credits[:, 0] == self.k, 1], 1)
+
+        state = self.live("state")
+        immune = self.live("immune")
+        infected_time = self.live("infected_time")
+        no_infected = self.live("no_infected")
+
+        # carrier behaviour, after the incubation period the carrier becomes an infected.
+        carrier = state == CARRIER
+        incubated = carrier & (self.live("carrier_time") < infected_time)
+        state[incubated] = INFECTED
+        counted = incubated & ~self.live("new_infection")
+        self.reproduction.add(no_infected[counted].sum(), np.count_nonzero(counted))
+        infected_time[carrier & ~incubated] += 1
+
+        # infected behaviour, agents may die, recover or stay infected.
+        infected = np.flatnonzero(state == INFECTED)
+        dies = sim.rng.random_sample(len(infected)) < sim.death_probabilities(infected_time[infected],
+                                                                              immune[infected])
+        recovers = ~dies & (pop["rec_time"][infected] < infected_time[infected])
+
+        recovered = infected[recovers]
+        counted = recovered[~pop["new_infection"][recovered]]
+        self.reproduction.discard(no_infected[counted].sum(), len(counted))
+        immune[recovered] = True
+        state[recovered] = SUSCEPTIBLE
+
+        infected_time[infected[~dies & ~recovers]] += 1
+
+        # The secondary cases of the dead keep counting towards the estimate, the ones infected this step start now.
+        dead = infected[dies]
+        counted = dead[pop["new_infection"][dead]]
+        self.reproduction.add(no_infected[counted].sum(), len(counted))
+        self.daily_casualties = len(dead)
+        if len(dead) > 0:
+            keep = np.ones(self.n, dtype=bool)
+            keep[dead] = False
+            self.compact(keep)
+        pop["counts"][live_count] = self.n
+
+    def counters(self):
+        """
+        This function returns the counters of the tile for the step, then starts counting the agents infected this
+        step towards the estimate of the basic reproduction number, as Simulation.update_one_unit_time() does.
+        """
+        state = self.live("state")
+        counters = (self.daily_infected, self.daily_casualties, self.reproduction.secondary_cases,
+                    self.reproduction.cases, np.count_nonzero(state != SUSCEPTIBLE), self.n)
+
+        new = np.flatnonzero(self.live("new_infection"))
+        self.live("new_infection")[new] = False
+        infected = new[state[new] == INFECTED]
+        self.reproduction.add(self.live("no_infected")[infected].sum(), len(infected))
+        return counters
+
+
+def run_tile(k, grid, params, seed, generator, names, control_name, capacity, ids, barrier, sync, pipe):
+    """
+    This function is the main loop of the worker process that owns tile k. It waits for a command from the main
+    process and runs the phases of a step in lockstep with the other workers.
+    """
+    worker = None
+    control = None
+    try:
+        worker = TileWorker(k, grid, params, seed, generator, names, capacity)
+        control = SharedArrays(control_fields(len(names)), control_name)
+        worker.initialize(*ids)
+        sync.wait()
+
+        while True:
+            sync.wait()
+            command = control["command"][0]
+            if command == stop_command:
+                break
+            if command == log_command:
+                pipe.send(("log", worker.transmissions.columns()))
+                continue
+
+            worker.time += 1
+            worker.move()
+            barrier.wait()
+            worker.immigrate()
+            barrier.wait()
+            worker.infect()
+            barrier.wait()
+            worker.progress()
+            control["counters"][k] = worker.counters()
+            sync.wait()
+
+    except BrokenBarrierError:
+        # Another process failed and reports it.
+        pass
+    except Exception:
+        pipe.send(("error", traceback.format_exc()))
+        barrier.abort()
+        sync.abort()
+    finally:
+        if worker is not None:
+            worker.close()
+        if control is not None:
+            control.close()
+
+
+class TiledSimulation(Simulation):
+    """
+    A run of the viral infection model with the synchronous updating scheme, spread over worker processes that each own
+    a tile of the unit square (see the module docstring). It records the same time series and statistics as
+    Simulation. The workers are started by initialize() and keep the agents until close() is called, or the context
+    manager exits, so the statistics have to be saved before that. Parameter changes take effect on the next
+    initialize().
+    """
+
+    def __init__(self, params=None, seed=42, output_path=None, workers=None, capacity_factor=1.5, generator="legacy",
+                 initialize=True, **overrides):
+        """
+        Build a tiled simulation like a Simulation, on at most "workers" processes (default: all cores). Every tile
+        has room for capacity_factor times its share of the population.
+        """
+        self.processes = []
+        super().__init__(params, seed=seed, output_path=output_path, engine="sync", generator=generator,
+                         initialize=False, **overrides)
+        self.engine = "tiled"
+        self.workers = workers or os.cpu_count()
+        self.capacity_factor = capacity_factor
+
+        if initialize:
+            self.initialize()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def initialize(self):
+        """
+        This function starts a worker process per tile and spreads the agents over the tiles, with the initial
+        infected agents at random positions.
+        """
+        self.close()
+
+        self.time = 0
+        self.stop_reason = None
+        self.current_output_path = None
+        if self.output_path is not None:
+            self.current_output_path = self.output_path / f"vac_rate_{str(self.vac_rate)}"
+
+        # The tiles are at least as wide as the neighbourhood radius and the furthest an agent moves in a step.
+        self.grid = tile_grid(self.workers, max(self.cd, self.speed))
+        tiles = self.grid[0] * self.grid[1]
+        seeds = task_seeds(self.seed, tiles + 1)
+
+        # Spread the agents over the tiles. The last "infected_init" ids are the initial infected agents.
+        rng = np.random.RandomState(seeds[0])
+        n_susceptible = rng.multinomial(self.pop_init - self.infected_init, [1 / tiles] * tiles)
+        n_infected = rng.multinomial(self.infected_init, [1 / tiles] * tiles)
+        first_id = np.concatenate(([0], np.cumsum(n_susceptible)[:-1]))
+        first_infected_id = self.pop_init - self.infected_init + np.concatenate(([0], np.cumsum(n_infected)[:-1]))
+        capacity = min(self.pop_init, math.ceil(self.capacity_factor * self.pop_init / tiles) + 1024)
+
+        context = get_context()
+        self.tiles = [SharedArrays(tile_fields(capacity)) for _ in range(tiles)]
+        self.control = SharedArrays(control_fields(tiles))
+        self.sync = context.Barrier(tiles + 1)
+        barrier = context.Barrier(tiles)
+        names = [tile.name for tile in self.tiles]
+
+        self.pipes = []
+        for k in range(tiles):
+            pipe, worker_pipe = context.Pipe()
+            ids = (int(first_id[k]), int(n_susceptible[k]), int(first_infected_id[k]), int(n_infected[k]))
+            process = context.Process(target=run_tile, daemon=True,
+                                      args=(k, self.grid, self.params, seeds[k + 1], self.generator, names,
+                                            self.control.name, capacity, ids, barrier, self.sync, worker_pipe))
+            process.start()
+            self.processes.append(process)
+            self.pipes.append(pipe)
+
+        # Wait for the workers to spawn their agents.
+        self.wait()
+
+        # initialise the metrics and time series.
+        self.infectious = self.infected_init
+        self.total_casualties = 0
+        self.total_infected = 0
+        self.daily_infected = 0
+        self.daily_casualties = 0
+
+        self.casualty_ts = [0]
+        self.infected_ts = [0]
+
+        self.total_infected_ts = [self.total_infected]
+        self.total_casualty_ts = [self.total_casualties]
+        self.basic_reproduction_number_ts = [0]
+
+    def wait(self):
+        """
+        This function waits for the workers at the barrier they share with the main process. If a worker failed, the
+        workers are stopped and its error is raised.
+        """
+        try:
+            self.sync.wait()
+        except BrokenBarrierError:
+            errors = [pipe.recv()[1] for pipe in self.pipes if pipe.poll(1)]
+            self.close()
+            raise RuntimeError("A tile worker failed:\n" + "\n".join(errors))
+
+    def command(self, command):
+        """
+        This function sends a command to every worker.
+        """
+        self.control["command"][0] = command
+        self.wait()
+
+    def close(self):
+        """
+        This function stops the workers and frees the shared memory of the tiles.
+        """
+        if not self.processes:
+            return
+
+        self.control["command"][0] = stop_command
+        try:
+            self.sync.wait(timeout=10)
+        except BrokenBarrierError:
+            pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+        for shared in self.tiles + [self.control]:
+            shared.close()
+        for pipe in self.pipes:
+            pipe.close()
+        self.processes = []
+
+    def is_finished(self):
+        """
+        This function checks if the epidemic is over, i.e. there are no carrier or infected agents left.
+        """
+        return self.infectious == 0
+
+    def update_one_unit_time(self):
+        """
+        This function advances every agent by one time unit on the workers and reduces their counters.
+        """
+        self.time += 1
+        self.command(step_command)
+        self.wait()
+
+        counters = dict(zip(counter_names, self.control["counters"].sum(axis=0).tolist()))
+        self.daily_infected = counters["daily_infected"]
+        self.daily_casualties = counters["daily_casualties"]
+        self.total_infected += self.daily_infected
+        self.total_casualties += self.daily_casualties
+        self.infectious = counters["infectious"]
+
+        # update infected and casualty time series
+        self.infected_ts.append(self.daily_infected)
+        self.casualty_ts.append(self.daily_casualties)
+        self.total_infected_ts.append(self.total_infected)
+        self.total_casualty_ts.append(self.total_casualties)
+        self.basic_reproduction_number_ts.append(
+            counters["secondary_cases"] / counters["cases"] if counters["cases"] > 0 else 0)
+
+    def agents(self, names=tuple(column_dtypes)):
+        """
+        This function returns copies of the columns of the live agents of every tile, in order of their ids.
+        """
+        columns = {name: np.concatenate([tile[name][:tile["counts"][live_count]] for tile in self.tiles])
+                   for name in set(names) | {"ids"}}
+        order = np.argsort(columns["ids"], kind="stable")
+        return {name: columns[name][order] for name in names}
+
+    def transmission_columns(self):
+        """
+        This function collects the transmission logs of the workers, in order of time.
+        """
+        self.command(log_command)
+        logs = [pipe.recv()[1] for pipe in self.pipes]
+        columns = {name: np.concatenate([log[name] for log in logs]) for name in log_dtypes}
+        order = np.argsort(columns["time"], kind="stable")
+        return {name: values[order] for name, values in columns.items()}
+
+    def snapshot(self):
+        """
+        This function returns a copy of what is needed to draw the current state of the simulation, as
+        Simulation.snapshot() does.
+        """
+        agents = self.agents(("x", "y", "state", "immune"))
+        return {"time": self.time,
+                "stop_reason": self.stop_reason,
+                "vac_rate": self.vac_rate,
+                "x": agents["x"],
+                "y": agents["y"],
+                "display_state": np.where((agents["state"] == SUSCEPTIBLE) & agents["immune"], IMMUNE,
+                                          agents["state"]),
+                "total_casualty_ts": np.array(self.total_casualty_ts)}
+
+    def statistics(self):
+        """
+        This function returns the time series, final agent state and transmission log of the simulation as a dictionary.
+        """
+        return {"infected_ts": self.infected_ts,
+                "total_infected_ts": self.total_infected_ts,
+                "casualty_ts": self.casualty_ts,
+                "total_casualty_ts": self.total_casualty_ts,
+                "basic_reproduction_number_ts": self.basic_reproduction_number_ts,
+                "agents": self.agents(),
+                "transmissions": self.transmission_columns()}
+
+    def header(self):
+        """
+        This function returns the parameters and summary of the run that are stored with its statistics, with the grid
+        of tiles.
+        """
+        return dict(super().header(), tiles=list(self.grid))
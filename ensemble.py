@@ -0,0 +1,257 @@
+"""
+Monte Carlo replicate ensembles
+
+Runs R replicates of a configuration with independent seeds and aggregates their time series as the replicates finish,
+so memory does not grow with R. For every time step a running mean and variance (Welford's algorithm) and a histogram
+sketch for the quantiles are kept. Replicates that end earlier than others are extended with their final value.
+
+Example, 1000 replicates of Covid at a 30% vaccination rate:
+    python ensemble.py --virus covid --replicates 1000 --grid vac_rate=0.3
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from simulation import Simulation, default_params, virus_dict, engines
+from sweep import parse_grid, expand_grid, task_seeds, point_output_path
+
+# The time series that are aggregated, with the origin and starting width of their histogram bins. Counts use bins
+# centred on whole numbers.
+ensemble_series = {"total_infected_ts": (-0.5, 1.0),
+                   "total_casualty_ts": (-0.5, 1.0),
+                   "basic_reproduction_number_ts": (0.0, 1 / 32)}
+
+# Quantiles reported in the bands.
+band_quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class StreamingSeries:
+    """
+    Per time step running statistics of one time series across replicates. The quantile sketch is a histogram with a
+    fixed number of bins per time step; when a value falls beyond the last bin, neighbouring bins are merged and the bin
+    width doubles, so the memory use is fixed by the number of time steps and bins.
+    """
+
+    def __init__(self, origin=0.0, width=1.0, bins=256):
+        self.origin = origin
+        self.width = width
+        self.bins = bins
+        self.count = 0
+
+        # Running statistics per time step.
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.hist = np.zeros((0, bins), dtype=np.int64)
+
+        # Running statistics of the final values, used for the time steps past the end of shorter replicates.
+        self.final_mean = 0.0
+        self.final_m2 = 0.0
+        self.final_hist = np.zeros(bins, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.mean)
+
+    def bin_of(self, values):
+        """
+        This function returns the histogram bin of each value, widening the bins first if a value is beyond the last.
+        """
+        while np.max(values) >= self.origin + self.bins * self.width:
+            self.hist = self.merge_pairs(self.hist)
+            self.final_hist = self.merge_pairs(self.final_hist[np.newaxis])[0]
+            self.width *= 2
+
+        return np.clip(((values - self.origin) // self.width).astype(np.int64), 0, self.bins - 1)
+
+    def merge_pairs(self, hist):
+        """
+        This function merges every pair of neighbouring bins of the rows of a histogram into the first half of the
+        bins. With an odd number of bins the last bin is merged with an empty one.
+        """
+        merged = np.pad(hist, ((0, 0), (0, self.bins % 2))).reshape(len(hist), -1, 2).sum(axis=2)
+        return np.pad(merged, ((0, 0), (0, self.bins - merged.shape[1])))
+
+    def add(self, series):
+        """
+        This function adds the time series of one replicate to the statistics.
+        """
+        series = np.asarray(series, dtype=float)
+        final = series[-1]
+
+        # Extend the earlier replicates with their final values, or this replicate with its own.
+        if len(series) > len(self):
+            extra = len(series) - len(self)
+            self.mean = np.concatenate([self.mean, np.full(extra, self.final_mean)])
+            self.m2 = np.concatenate([self.m2, np.full(extra, self.final_m2)])
+            self.hist = np.concatenate([self.hist, np.tile(self.final_hist, (extra, 1))])
+        elif len(series) < len(self):
+            series = np.concatenate([series, np.full(len(self) - len(series), final)])
+
+        bins = self.bin_of(series)
+
+        # Welford's update of the mean and sum of squared differences.
+        self.count += 1
+        delta = series - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (series - self.mean)
+        self.hist[np.arange(len(series)), bins] += 1
+
+        delta = final - self.final_mean
+        self.final_mean += delta / self.count
+        self.final_m2 += delta * (final - self.final_mean)
+        self.final_hist[bins[-1]] += 1
+
+    def variance(self):
+        """
+        This function returns the sample variance per time step.
+        """
+        if self.count < 2:
+            return np.zeros(len(self))
+        return self.m2 / (self.count - 1)
+
+    def quantile(self, q):
+        """
+        This function estimates the q quantile per time step from the histogram sketch, interpolating within the bin.
+        """
+        target = q * self.count
+        cumulative = np.cumsum(self.hist, axis=1)
+        bins = np.minimum((cumulative < target).sum(axis=1), self.bins - 1)
+
+        steps = np.arange(len(self))
+        before = np.where(bins > 0, cumulative[steps, bins - 1], 0)
+        within = self.hist[steps, bins]
+        fraction = np.where(within > 0, (target - before) / np.maximum(within, 1), 0)
+
+        return self.origin + (bins + fraction) * self.width
+
+
+class Ensemble:
+    """
+    The streaming aggregate of the time series of an ensemble of replicates.
+    """
+
+    def __init__(self, bins=256):
+        self.series = {name: StreamingSeries(origin, width, bins) for name, (origin, width) in ensemble_series.items()}
+        self.replicates = 0
+
+    def add(self, statistics):
+        """
+        This function adds the time series of one replicate to the ensemble.
+        """
+        for name, series in self.series.items():
+            series.add(statistics[name])
+        self.replicates += 1
+
+    def bands(self):
+        """
+        This function returns the mean, standard deviation and quantiles per time step of every aggregated series.
+        """
+        bands = {}
+        for name, series in self.series.items():
+            bands[name] = {"mean": series.mean.copy(), "std": np.sqrt(series.variance())}
+            for q in band_quantiles:
+                bands[name][f"q{round(q * 100):02d}"] = series.quantile(q)
+        return bands
+
+    def save(self, path):
+        """
+        This function saves the bands to a .npz file with entries named <series>/<statistic>.
+        """
+        arrays = {f"{name}/{stat}": values for name, stats in self.bands().items() for stat, values in stats.items()}
+        np.savez(path, replicates=self.replicates, **arrays)
+        return path
+
+
+def run_replicate(task):
+    """
+    This function runs one replicate and returns only the aggregated time series. It runs in the worker processes.
+    """
+    params, seed, until, options = task
+    sim = Simulation(params, seed=seed, **options)
+    sim.run(until=until)
+    return {name: sim.statistics()[name] for name in ensemble_series}
+
+
+def run_ensemble(params, replicates, seed=42, until=None, workers=None, bins=256, **options):
+    """
+    This function runs "replicates" independent replicates of a configuration on a process pool and returns the
+    Ensemble of their time series. Only a bounded number of replicates are in flight at any time, so the memory use
+    does not depend on the number of replicates.
+    """
+    ensemble = Ensemble(bins)
+    seeds = iter(task_seeds(seed, replicates))
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        max_in_flight = 2 * workers
+
+        while True:
+            # Keep the pool busy without queueing every replicate at once.
+            for replicate_seed in seeds:
+                in_flight.add(executor.submit(run_replicate, (params, replicate_seed, until, options)))
+                if len(in_flight) >= max_in_flight:
+                    break
+
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                ensemble.add(future.result())
+
+    return ensemble
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Monte Carlo replicates of the viral simulation.")
+    parser.add_argument("--virus", default="default",
+                        help="virus to take the base parameters from: " + ", ".join(virus_dict))
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=VALUES",
+                        help="configurations to run, as in sweep.py. Defaults to the base parameters")
+    parser.add_argument("--replicates", type=int, default=100, help="number of replicates per configuration")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42, help="base seed for the replicate seeds")
+    parser.add_argument("--until", type=int, default=None, help="maximum number of days to simulate")
+    parser.add_argument("--bins", type=int, default=256, help="histogram bins per time step for the quantiles")
+    parser.add_argument("--engine", choices=engines, default="async", help="updating scheme of the simulation")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="output directory (default: Simulations/<virus>_ensemble_<timestamp>)")
+    args = parser.parse_args(argv)
+
+    virus_name = args.virus.strip().lower()
+    if virus_name != "default" and virus_name not in virus_dict:
+        parser.error(f"unknown virus {args.virus!r}")
+    params = dict(default_params, **virus_dict.get(virus_name, {}))
+
+    output_path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        output_path = Path.cwd() / "Simulations" / f"{virus_name}_ensemble_{timestamp}"
+
+    for i, point in enumerate(expand_grid(parse_grid(args.grid))):
+        start = time.perf_counter()
+        point_params = dict(params, **point)
+
+        # Every configuration gets its own seed stream.
+        ensemble = run_ensemble(point_params, args.replicates, seed=task_seeds(args.seed, i + 1)[i], until=args.until,
+                                workers=args.workers, bins=args.bins, engine=args.engine)
+
+        # Save the bands in the vac_rate_X directory of the configuration.
+        current_output_path = point_output_path(output_path, point) / f"vac_rate_{str(point_params['vac_rate'])}"
+        current_output_path.mkdir(parents=True, exist_ok=True)
+        ensemble.save(current_output_path / "ensemble.npz")
+        with open(current_output_path / "ensemble.json", "w") as handle:
+            json.dump({"params": point_params, "replicates": args.replicates, "seed": args.seed}, handle, indent=2)
+
+        print(f"{point}: {args.replicates} replicates ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Background frame writer
+
+Saving a frame with savefig() encodes the PNG and writes it to disk on the simulation thread, so every time step waits
+for the encoder. The FrameWriter takes the rendered pixels of a frame and hands them to writer threads through a
+bounded queue; the threads encode and write the PNG files while the simulation keeps stepping. When the queue is full,
+submitting a frame blocks until a writer has caught up, so a slow disk slows the simulation down instead of filling
+the memory with frames.
+
+The files keep the <time>_agents.png names used by gif_creation.py. Frames can also be passed to an animation sink
+(see animation.py), which then encodes them on the writer thread in the order they were submitted, as long as the
+writer has a single thread.
+
+Example:
+    with FrameWriter() as writer:
+        writer.submit_figure(figure, agents_path / f"{sim.time}_agents.png")
+"""
+
+import queue
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+class FrameWriter:
+    """
+    Encodes and writes frames on background threads, fed through a bounded queue.
+    """
+
+    def __init__(self, max_queued=16, workers=1, compress_level=6):
+        """
+        Start "workers" writer threads. At most "max_queued" frames wait in the queue, submit() blocks beyond that.
+        """
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.compress_level = compress_level
+        self.frames_written = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+        self.threads = [threading.Thread(target=self.write_frames, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_frames(self):
+        """
+        This function is the loop of the writer threads, it writes frames until it gets the None sentinel.
+        """
+        while True:
+            frame = self.queue.get()
+            try:
+                if frame is None:
+                    return
+
+                target, pixels = frame
+                if hasattr(target, "add_frame"):
+                    target.add_frame(pixels)
+                else:
+                    Image.fromarray(pixels).save(target, compress_level=self.compress_level)
+                with self.lock:
+                    self.frames_written += 1
+
+            # Keep the first error, it is raised on the simulation thread by the next submit() or flush().
+            except Exception as error:
+                if self.error is None:
+                    self.error = error
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        """
+        This function raises the first error of the writer threads, if any.
+        """
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, target, pixels):
+        """
+        This function queues an RGB(A) pixel array to be written to "target", a PNG path or an animation sink, waiting
+        for room in the queue if it is full.
+        """
+        self.check()
+        if self.threads is None:
+            raise RuntimeError("FrameWriter has been closed")
+        self.queue.put((target, pixels))
+
+    def submit_figure(self, figure, *targets):
+        """
+        This function renders a matplotlib figure and queues its pixels to be written to every target. Rendering
+        happens on the calling thread, as matplotlib is not thread safe; only the encoding and writing are in the
+        background.
+        """
+        figure.canvas.draw()
+        pixels = np.array(figure.canvas.buffer_rgba())
+        for target in targets:
+            self.submit(target, pixels)
+
+    def flush(self):
+        """
+        This function waits until every queued frame has been written.
+        """
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        """
+        This function writes the remaining frames and stops the writer threads. Closing twice is harmless.
+        """
+        if self.threads is None:
+            return
+
+        self.queue.join()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = None
+        self.check()
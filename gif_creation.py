@@ -1,21 +1,109 @@
+"""
+GIF builder for the Simulations directory
+
+Builds the sim.gif of every run (every directory with saved frames in Plots/agents) in parallel across a process pool.
+A small manifest (sim.gif.json) records the frames each GIF was built from, and a GIF is only rebuilt when its frames
+have changed since, so re-running the script after a few new runs only encodes the new ones. GIFs without a manifest,
+such as the ones streamed by the GUI, are kept if they are newer than all of their frames. Runs without frames are
+skipped.
+
+Example:
+    python gif_creation.py --workers 8
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from PIL import Image
 
+from animation import encode_gif, png_frames, frame_duration
+
+gif_name = "sim.gif"
+manifest_name = "sim.gif.json"
+
+
+def find_runs(root):
+    """
+    This function returns the run directories under "root" that have a Plots/agents directory, in sorted order. Runs
+    of parameter sweeps can be nested deeper than Simulations/<virus>_<timestamp>/vac_rate_X.
+    """
+    return sorted(agents_path.parent.parent for agents_path in Path(root).glob("**/Plots/agents")
+                  if agents_path.is_dir())
+
+
+def frames_manifest(agents_path):
+    """
+    This function describes the saved frames of a run by their number, newest modification time and total size.
+    """
+    stats = [path.stat() for path in agents_path.glob("*_agents.png")]
+    return {"frames": len(stats),
+            "newest": max((stat.st_mtime_ns for stat in stats), default=0),
+            "bytes": sum(stat.st_size for stat in stats)}
+
+
+def is_up_to_date(run_path, manifest):
+    """
+    This function checks whether the GIF of a run was built from the frames described by "manifest".
+    """
+    gif_path = run_path / gif_name
+    if not gif_path.exists():
+        return False
+
+    manifest_path = run_path / manifest_name
+    if manifest_path.exists():
+        with open(manifest_path) as handle:
+            return json.load(handle) == manifest
+
+    # Without a manifest, the GIF is up to date if it was written after the newest frame.
+    return gif_path.stat().st_mtime_ns >= manifest["newest"]
+
+
+def build_gif(run_path, force=False):
+    """
+    This function (re)builds the GIF of a run if needed and returns the run, what was done and how long it took. It
+    runs in the worker processes.
+    """
+    start = time.perf_counter()
+    agents_path = run_path / "Plots" / "agents"
+    manifest = frames_manifest(agents_path)
+
+    if manifest["frames"] == 0:
+        return run_path, "no frames", time.perf_counter() - start
+    if not force and is_up_to_date(run_path, manifest):
+        return run_path, "up to date", time.perf_counter() - start
+
+    # Encode into a temporary file so an interrupted build never leaves a truncated GIF behind.
+    temporary_path = run_path / (gif_name + ".tmp")
+    frames = encode_gif(png_frames(agents_path), temporary_path, duration=frame_duration, loop=0)
+    os.replace(temporary_path, run_path / gif_name)
+
+    with open(run_path / manifest_name, "w") as handle:
+        json.dump(manifest, handle)
+
+    return run_path, f"built from {frames} frames", time.perf_counter() - start
 
-def helper(path_object):
-    return int(path_object.name.split("_")[0])
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the GIFs of the simulation runs from their saved frames.")
+    parser.add_argument("root", nargs="?", type=Path, default=Path.cwd() / "Simulations",
+                        help="directory to search for runs (default: ./Simulations)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="rebuild every GIF, even if it is up to date")
+    args = parser.parse_args(argv)
 
-simulations = list((Path.cwd() / "Simulations").iterdir())
+    runs = find_runs(args.root)
+    start = time.perf_counter()
 
-for sim in simulations:
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(build_gif, run_path, args.force) for run_path in runs]
+        for future in as_completed(futures):
+            run_path, status, seconds = future.result()
+            print(f"{run_path.relative_to(args.root)}: {status} ({seconds:.2f}s)")
 
-    # filepaths
-    for vac_rate in sim.iterdir():
-        agent_plots = sorted(list((vac_rate / "Plots" / "agents").iterdir()), key=helper)
+    print(f"{len(runs)} runs in {time.perf_counter() - start:.1f}s")
 
-        fp_out = vac_rate / "sim.gif"
 
-        img, *imgs = [Image.open(p) for p in agent_plots]
-        img.save(fp=fp_out, format='GIF', append_images=imgs,
-                 save_all=True, duration=200, loop=0)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Array backed agent population
+
+The agents are stored as a struct of arrays: each attribute that used to live on an agent instance is a NumPy column
+and an agent is a row in those columns. Only the first n rows are live. Deaths are handled with a swap-remove, the last
+live row is moved into the gap, so removing an agent costs O(1) and the live rows stay contiguous.
+
+The rows in each display state (susceptible, carrier, infected, immune) and their counts are kept in a StateIndex that
+is updated when an agent changes state, so the engine can read the counts in O(1) instead of scanning the population.
+"""
+
+import numpy as np
+
+# State codes for the state column.
+SUSCEPTIBLE = 0
+CARRIER = 1
+INFECTED = 2
+
+# Display state code for susceptible agents that are immune (vaccinated or recovered). Immunity is stored in its own
+# column, this code is only used when the agents are plotted or counted by display state.
+IMMUNE = 3
+
+state_names = ("susceptible", "carrier", "infected", "immune")
+
+# The columns of the population and their types.
+column_dtypes = {"ids": np.int64,  # stable id of the agent, unaffected by swap-removes
+                 "x": np.float64,
+                 "y": np.float64,
+                 "state": np.int8,
+                 "immune": np.bool_,
+                 "prior_infection": np.bool_,
+                 "new_infection": np.bool_,
+                 "infected_time": np.int32,
+                 "rec_time": np.float64,
+                 "carrier_time": np.float64,
+                 "no_infected": np.int32}
+
+
+class StateIndex:
+    """
+    The rows of the population in each display state and their counts. Each state keeps its rows in a dense member
+    array and every row knows its position in that array, so adding, removing and relabelling a row are O(1).
+    """
+
+    def __init__(self, capacity, n_states=len(state_names)):
+        self.members = np.zeros((n_states, capacity), dtype=np.int64)
+        self.counts = np.zeros(n_states, dtype=np.int64)
+
+        # The display state of every row (-1 if not indexed) and its position in the members of that state.
+        self.state_of = np.full(capacity, -1, dtype=np.int8)
+        self.position = np.zeros(capacity, dtype=np.int64)
+
+    def add(self, row, state):
+        """
+        This function adds a row to the members of a state.
+        """
+        count = self.counts[state]
+        self.members[state, count] = row
+        self.position[row] = count
+        self.state_of[row] = state
+        self.counts[state] = count + 1
+
+    def discard(self, row):
+        """
+        This function removes a row from the members of its state, moving the last member into its place.
+        """
+        state = self.state_of[row]
+        last = self.counts[state] - 1
+        moved = self.members[state, last]
+
+        self.members[state, self.position[row]] = moved
+        self.position[moved] = self.position[row]
+        self.counts[state] = last
+        self.state_of[row] = -1
+
+    def move(self, row, state):
+        """
+        This function moves a row to the members of another state.
+        """
+        if self.state_of[row] != state:
+            self.discard(row)
+            self.add(row, state)
+
+    def discard_rows(self, rows):
+        """
+        This function removes many rows, all indexed, from the members of their states at once. The members at the end
+        of every state fill the positions that were freed, so the cost is in the number of rows.
+        """
+        states = self.state_of[rows]
+        self.state_of[rows] = -1
+        for state in np.unique(states).tolist():
+            freed = self.position[rows[states == state]]
+            count = self.counts[state] - len(freed)
+
+            # The members past the new count that stay move into the freed positions before the new count.
+            tail = self.members[state, count:self.counts[state]]
+            staying = tail[self.state_of[tail] == state]
+            holes = freed[freed < count]
+            self.members[state, holes] = staying
+            self.position[staying] = holes
+            self.counts[state] = count
+
+    def move_rows(self, rows, state):
+        """
+        This function moves many rows to the members of a state at once.
+        """
+        rows = rows[self.state_of[rows] != state]
+        self.discard_rows(rows)
+
+        count = self.counts[state]
+        self.members[state, count:count + len(rows)] = rows
+        self.position[rows] = np.arange(count, count + len(rows))
+        self.state_of[rows] = state
+        self.counts[state] = count + len(rows)
+
+    def relabel_rows(self, old_rows, new_rows):
+        """
+        This function renames many indexed rows at once, like relabel().
+        """
+        states = self.state_of[old_rows]
+        self.members[states, self.position[old_rows]] = new_rows
+        self.position[new_rows] = self.position[old_rows]
+        self.state_of[old_rows] = -1
+        self.state_of[new_rows] = states
+
+    def relabel(self, old_row, new_row):
+        """
+        This function renames an indexed row after the population moved the agent from old_row to new_row.
+        """
+        state = self.state_of[old_row]
+        self.members[state, self.position[old_row]] = new_row
+        self.position[new_row] = self.position[old_row]
+        self.state_of[new_row] = state
+        self.state_of[old_row] = -1
+
+    def rebuild(self, display_state):
+        """
+        This function rebuilds the index from the display state of every live row.
+        """
+        self.state_of[:] = -1
+        for state in range(len(self.counts)):
+            rows = np.flatnonzero(display_state == state)
+            self.members[state, :len(rows)] = rows
+            self.position[rows] = np.arange(len(rows))
+            self.state_of[rows] = state
+            self.counts[state] = len(rows)
+
+    def rows(self, state):
+        """
+        This function returns the rows in a state, in no particular order.
+        """
+        return self.members[state, :self.counts[state]]
+
+
+class Population:
+    """
+    A fixed capacity population of agents stored column-wise. The population never grows after initialisation, so the
+    capacity is the initial population size.
+    """
+
+    def __init__(self, capacity):
+        """
+        Allocate the columns for "capacity" agents. All agents start as susceptible at the origin.
+        """
+        self.capacity = capacity
+        self.n = capacity
+
+        for name, dtype in column_dtypes.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+        # The row of every agent id, -1 once the agent has been removed.
+        self.ids[:] = np.arange(capacity)
+        self.row_of = np.arange(capacity)
+
+        # Every agent starts as susceptible.
+        self.index = StateIndex(capacity)
+        self.index.rebuild(self.display_state())
+
+    def __len__(self):
+        return self.n
+
+    def live(self, name):
+        """
+        This function returns a view on the live rows of a column.
+        """
+        return getattr(self, name)[:self.n]
+
+    def count(self, state):
+        """
+        This function returns the number of live agents in a display state.
+        """
+        return int(self.index.counts[state])
+
+    def rows(self, state):
+        """
+        This function returns the rows of the live agents in a display state, in no particular order.
+        """
+        return self.index.rows(state)
+
+    def set_state(self, i, state):
+        """
+        This function sets the state of the agent in row i, keeping the state index up to date.
+        """
+        self.state[i] = state
+        self.index.move(i, IMMUNE if state == SUSCEPTIBLE and self.immune[i] else state)
+
+    def set_states(self, rows, state):
+        """
+        This function sets the state of the agents in "rows", keeping the state index up to date at a cost in the number
+        of rows rather than in the population size.
+        """
+        self.state[rows] = state
+        if state == SUSCEPTIBLE:
+            immune = self.immune[rows]
+            self.index.move_rows(rows[immune], IMMUNE)
+            self.index.move_rows(rows[~immune], SUSCEPTIBLE)
+        else:
+            self.index.move_rows(rows, state)
+
+    def set_immune(self, i, immune=True):
+        """
+        This function sets the immunity of the agent in row i, keeping the state index up to date.
+        """
+        self.immune[i] = immune
+        if self.state[i] == SUSCEPTIBLE:
+            self.index.move(i, IMMUNE if immune else SUSCEPTIBLE)
+
+    def recount(self):
+        """
+        This function rebuilds the state index from the columns, after they have been written in bulk.
+        """
+        self.index.rebuild(self.display_state())
+
+    def check_index(self):
+        """
+        This function cross-checks the state index and the id to row mapping against a full scan of the population.
+        It is used in debug mode.
+        """
+        display_state = self.display_state()
+        for state, name in enumerate(state_names):
+            rows = np.flatnonzero(display_state == state)
+            if self.count(state) != len(rows) or not np.array_equal(np.sort(self.rows(state)), rows):
+                raise RuntimeError(f"State index out of sync for {name}: {self.count(state)} indexed, "
+                                   f"{len(rows)} in the population")
+
+        if not np.array_equal(self.row_of[self.live("ids")], np.arange(self.n)):
+            raise RuntimeError("Id to row mapping out of sync with the population")
+
+    def remove(self, i):
+        """
+        This function removes the agent in row i by moving the last live agent into its place. The old row of the
+        moved agent is returned, or None if row i was the last row.
+        """
+        last = self.n - 1
+        self.n = last
+
+        self.index.discard(i)
+        self.row_of[self.ids[i]] = -1
+
+        if i == last:
+            return None
+
+        for name in column_dtypes:
+            column = getattr(self, name)
+            column[i] = column[last]
+
+        self.index.relabel(last, i)
+        self.row_of[self.ids[i]] = i
+
+        return last
+
+    def remove_rows(self, rows):
+        """
+        This function removes the agents in "rows" at once, like remove(): the live agents past the new end that stay
+        are moved into the rows that were freed.
+        """
+        n = self.n - len(rows)
+        self.index.discard_rows(rows)
+        self.row_of[self.ids[rows]] = -1
+
+        leaving = np.zeros(self.n - n, dtype=bool)
+        leaving[rows[rows >= n] - n] = True
+        staying = n + np.flatnonzero(~leaving)
+        holes = rows[rows < n]
+
+        for name in column_dtypes:
+            column = getattr(self, name)
+            column[holes] = column[staying]
+
+        self.index.relabel_rows(staying, holes)
+        self.row_of[self.ids[holes]] = holes
+        self.n = n
+
+    def display_state(self):
+        """
+        This function returns the display state code (susceptible, carrier, infected or immune) of every live agent.
+        """
+        state = self.live("state")
+        return np.where((state == SUSCEPTIBLE) & self.live("immune"), IMMUNE, state)
+
+    def to_dict(self):
+        """
+        This function returns copies of the live rows of every column.
+        """
+        return {name: self.live(name).copy() for name in column_dtypes}
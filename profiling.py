@@ -0,0 +1,92 @@
+"""
+Per-phase profiling of the simulation
+
+A Profiler accumulates the wall time and number of calls of each phase of a time step: movement, the neighbour search,
+infection, disease progression, the metrics bookkeeping, and in the GUI the rendering and saving of frames. Every time
+step ends with a row of the trace, which can be written as CSV or JSON, and summary() gives a one line overview for the
+status bar of the GUI.
+
+Profiling is off unless a Simulation is created with profile=True. The engines then only check whether a profiler is
+set at each phase boundary, so the cost when disabled is negligible.
+
+Example:
+    sim = Simulation(virus_dict["covid"], pop_init=10000, profile=True)
+    sim.run(until=50)
+    sim.profiler.write_csv("trace.csv")
+"""
+
+import csv
+import json
+import time
+
+# The phases in the order they happen in a time step.
+phases = ("movement", "neighbour_search", "infection", "progression", "metrics", "render", "save")
+
+
+class Profiler:
+    """
+    Accumulates the time and calls per phase, for the current time step and for the whole run.
+    """
+
+    def __init__(self):
+        self.step_seconds = dict.fromkeys(phases, 0.0)
+        self.step_calls = dict.fromkeys(phases, 0)
+        self.total_seconds = dict.fromkeys(phases, 0.0)
+        self.total_calls = dict.fromkeys(phases, 0)
+        self.trace = []
+
+    def lap(self, phase, start):
+        """
+        This function adds the time since "start" to a phase and returns the current time, the start of the next phase.
+        """
+        now = time.perf_counter()
+        self.step_seconds[phase] += now - start
+        self.step_calls[phase] += 1
+        return now
+
+    def end_step(self, time_step):
+        """
+        This function closes the current time step: its times become a row of the trace and are added to the totals.
+        Phases that happen after the step (rendering, saving) are counted in the next row.
+        """
+        row = {"time": time_step}
+        for phase in phases:
+            row[f"{phase}_seconds"] = self.step_seconds[phase]
+            row[f"{phase}_calls"] = self.step_calls[phase]
+            self.total_seconds[phase] += self.step_seconds[phase]
+            self.total_calls[phase] += self.step_calls[phase]
+            self.step_seconds[phase] = 0.0
+            self.step_calls[phase] = 0
+        self.trace.append(row)
+
+    def summary(self, last=10):
+        """
+        This function returns a one line summary of the mean time per step of every phase over the last steps.
+        """
+        rows = self.trace[-last:]
+        if not rows:
+            return "No steps profiled yet"
+
+        means = {phase: sum(row[f"{phase}_seconds"] for row in rows) / len(rows) for phase in phases}
+        total = sum(means.values())
+        parts = [f"{phase} {1000 * seconds:.1f}ms" for phase, seconds in means.items() if seconds > 0]
+        return f"t = {rows[-1]['time']}: {1000 * total:.1f}ms/step (" + ", ".join(parts) + ")"
+
+    def write_csv(self, path):
+        """
+        This function writes the per-step trace as CSV.
+        """
+        with open(path, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=["time"] + [f"{phase}_{unit}" for phase in phases
+                                                                   for unit in ("seconds", "calls")])
+            writer.writeheader()
+            writer.writerows(self.trace)
+
+    def write_json(self, path):
+        """
+        This function writes the per-step trace and the totals as JSON.
+        """
+        with open(path, "w") as handle:
+            json.dump({"totals": {phase: {"seconds": self.total_seconds[phase], "calls": self.total_calls[phase]}
+                                  for phase in phases},
+                       "trace": self.trace}, handle, indent=2)
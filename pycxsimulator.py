@@ -26,6 +26,15 @@
 ## fixed grid() and pack() problem on 2016-06-21(Tue) 18:29:40
 ##
 ## various bug fixes and updates by Steve Morgan on 3/28/2020
+##
+## Optional worker thread mode: with start(..., snapshotFunc=...) the model is stepped on a worker thread that publishes
+## snapshots of its state, and the Tk main thread draws the latest one at a target frame rate, dropping stale ones.
+## Run/pause, reset and parameter changes are passed to the worker as commands, so the window stays responsive even
+## when a single step takes seconds.
+
+import queue
+import threading
+import time
 
 import matplotlib
 
@@ -55,7 +64,7 @@ warnings.filterwarnings("ignore", category = matplotlib.cbook.MatplotlibDeprecat
 class GUI:
 
     # Constructor
-    def __init__(self, title='PyCX Simulator', interval=0, stepSize=1, parameterSetters=[]):
+    def __init__(self, title='PyCX Simulator', interval=0, stepSize=1, parameterSetters=[], targetFps=25):
 
         ## all GUI variables moved to inside constructor by Hiroki Sayama 10/09/2018
 
@@ -70,6 +79,18 @@ class GUI:
         self.modelFigure = None
         self.currentStep = 0
 
+        # worker thread mode (see start())
+        self.targetFps = targetFps
+        self.worker = None
+        self.quitting = False
+        self.stopPending = False
+        self.commands = queue.Queue()
+        self.snapshots = queue.Queue(maxsize=1)
+        self.keepFunc = None
+        self.drawLock = threading.Lock()
+        self.lastDrawnStep = 0
+        self.droppedFrames = 0
+
         # initGUI() removed by Hiroki Sayama 10/09/2018
         
         #create root window
@@ -207,9 +228,15 @@ class GUI:
         self.timeInterval= int(val)
         
     def saveParametersCmd(self):
-        for variableSetter in self.parameterSetters:
-            variableSetter(float(self.varEntries[variableSetter].get()))
-            self.setStatusStr("New parameter values have been set")
+        values = [(variableSetter, float(self.varEntries[variableSetter].get()))
+                  for variableSetter in self.parameterSetters]
+
+        def setParameters():
+            for variableSetter, value in values:
+                variableSetter(value)
+
+        self.runOnModel(setParameters)
+        self.setStatusStr("New parameter values have been set")
             
     def saveParametersAndResetCmd(self):
         self.saveParametersCmd()
@@ -220,7 +247,9 @@ class GUI:
     def runEvent(self):
         self.running = not self.running
         if self.running:
-            self.rootWindow.after(self.timeInterval,self.stepModel)
+            # in worker thread mode the worker steps the model while running
+            if self.worker is None:
+                self.rootWindow.after(self.timeInterval,self.stepModel)
             self.runPauseString.set("Pause")
             self.buttonStep.configure(state=DISABLED)
             self.buttonReset.configure(state=DISABLED)
@@ -241,37 +270,162 @@ class GUI:
             self.currentStep += 1
             self.setStatusStr("Step "+str(self.currentStep))
             self.status.configure(foreground='black')
-            if (self.currentStep) % self.stepSize == 0:
+            if (self.currentStep) % self.stepSize == 0 or not self.running:
                 self.drawModel()
-            self.rootWindow.after(int(self.timeInterval*1.0/self.stepSize),self.stepModel)
+            # the step function may have stopped the run (see stopRunning)
+            if self.running:
+                self.rootWindow.after(int(self.timeInterval*1.0/self.stepSize),self.stepModel)
+
+    # <<<< stopRunning >>>>
+    # Called by the model when a run has finished, so no further steps are scheduled. On the worker thread the
+    # buttons are updated by the main thread, the next time it polls for a snapshot.
+    def stopRunning(self):
+        self.running = False
+        if threading.current_thread() is self.worker:
+            self.stopPending = True
+            return
+        self.runPauseString.set("Run")
+        self.buttonRun.configure(state=DISABLED)
+        self.buttonStep.configure(state=NORMAL)
+        self.buttonReset.configure(state=NORMAL)
+        if len(self.parameterSetters) > 0:
+            self.buttonSaveParameters.configure(state=NORMAL)
+            self.buttonSaveParametersAndReset.configure(state=NORMAL)
 
     def stepOnce(self):
         self.running = False
         self.runPauseString.set("Continue Run")
-        self.modelStepFunc()
-        self.currentStep += 1
-        self.setStatusStr("Step "+str(self.currentStep))
-        self.drawModel()
+        if self.worker is not None:
+            self.commands.put(self.workerStep)
+        else:
+            self.modelStepFunc()
+            self.currentStep += 1
+            self.setStatusStr("Step "+str(self.currentStep))
+            self.drawModel()
         if len(self.parameterSetters) > 0:
             self.buttonSaveParameters.configure(state=NORMAL)
 
     def resetModel(self):
         self.running = False        
         self.runPauseString.set("Run")
-        self.modelInitFunc()
-        self.currentStep = 0;
+        self.buttonRun.configure(state=NORMAL)
+        if self.worker is not None:
+            self.commands.put(self.workerReset)
+        else:
+            self.modelInitFunc()
+            self.currentStep = 0;
+            self.drawModel()
         self.setStatusStr("Model has been reset")
-        self.drawModel()
 
-    def drawModel(self):
+    def drawModel(self, snapshot=None):
         plt.ion() #SM 3/26/2020
         if self.modelFigure == None or self.modelFigure.canvas.manager.window == None: 
             self.modelFigure = plt.figure() #SM 3/26/2020
-        self.modelDrawFunc()
+        if snapshot is None:
+            self.modelDrawFunc()
+        else:
+            self.modelDrawFunc(snapshot)
         self.modelFigure.canvas.manager.window.update()
         plt.show() # bug fix by Hiroki Sayama in 2016 #SM 3/26/2020
 
-    def start(self,func=[]):
+    # <<<< worker thread mode >>>>
+    # Runs a model function on the worker thread between two steps, or straight away without a worker.
+    def runOnModel(self, func):
+        if self.worker is not None:
+            self.commands.put(func)
+        else:
+            func()
+
+    def workerStep(self):
+        self.modelStepFunc()
+        self.currentStep += 1
+
+    def workerReset(self):
+        self.modelInitFunc()
+        self.currentStep = 0
+        self.lastDrawnStep = 0
+
+    def workerLoop(self):
+        while not self.quitting:
+            # commands (single steps, resets, parameter changes) come first, and are only waited for while paused
+            try:
+                command = self.commands.get(timeout=0 if self.running else 0.05)
+            except queue.Empty:
+                command = None
+
+            if command is not None:
+                # the main thread does not draw while a command changes the model
+                with self.drawLock:
+                    command()
+            elif self.running:
+                self.workerStep()
+            else:
+                continue
+
+            self.publishSnapshot()
+            if self.running and self.timeInterval > 0:
+                time.sleep(self.timeInterval / 1000)
+
+    def publishSnapshot(self):
+        # only the latest snapshot is kept, one the main thread has not drawn yet is dropped. Snapshots that keepFunc
+        # marks (e.g. frames the model saves) are never dropped: the worker waits until the main thread has taken them,
+        # so the saved output does not depend on how fast the machine draws.
+        snapshot = self.snapshotFunc()
+        keep = self.keepFunc is not None and self.keepFunc(snapshot)
+        try:
+            queued = self.snapshots.get_nowait()
+            if queued[2]:
+                self.snapshots.put_nowait(queued)
+            else:
+                self.droppedFrames += 1
+        except queue.Empty:
+            pass
+
+        while not self.quitting:
+            try:
+                self.snapshots.put((self.currentStep, snapshot, keep), timeout=0.05)
+                return
+            except queue.Full:
+                if not keep:
+                    self.droppedFrames += 1
+                    return
+
+    def pollSnapshot(self):
+        if self.quitting:
+            return
+        started = time.perf_counter()
+
+        if self.stopPending:
+            self.stopPending = False
+            self.stopRunning()
+
+        # nothing is drawn while a command holds the lock, the snapshot stays queued until the next poll
+        snapshot = None
+        if self.drawLock.acquire(blocking=False):
+            try:
+                step, snapshot, _ = self.snapshots.get_nowait()
+            except queue.Empty:
+                self.drawLock.release()
+
+        if snapshot is not None:
+            try:
+                # the number of steps between drawn frames adapts to how long the steps and the drawing take
+                self.setStatusStr("Step "+str(step)+" (drawing every "+str(max(step - self.lastDrawnStep, 1))+
+                                  " steps, "+str(self.droppedFrames)+" frames dropped)")
+                self.status.configure(foreground='black')
+                self.lastDrawnStep = step
+                self.drawModel(snapshot)
+            finally:
+                self.drawLock.release()
+
+        # poll again at the target frame rate, less the time spent drawing
+        elapsed = int(1000 * (time.perf_counter() - started))
+        self.rootWindow.after(max(int(1000 / self.targetFps) - elapsed, 1), self.pollSnapshot)
+
+    # With snapshotFunc, the model is stepped on a worker thread and the draw function is called on the main thread
+    # with the latest snapshot returned by snapshotFunc instead of without arguments. Snapshots for which keepFunc
+    # returns True are always drawn.
+    def start(self,func=[],snapshotFunc=None,keepFunc=None):
         if len(func)==3:
             self.modelInitFunc = func[0]
             self.modelDrawFunc = func[1]
@@ -285,11 +439,24 @@ class GUI:
                 self.textInformation.config(state=DISABLED)
                 
             self.modelInitFunc()
-            self.drawModel()     
+            if snapshotFunc is not None:
+                self.snapshotFunc = snapshotFunc
+                self.keepFunc = keepFunc
+                self.drawModel(snapshotFunc())
+                self.worker = threading.Thread(target=self.workerLoop, daemon=True)
+                self.worker.start()
+                self.rootWindow.after(int(1000 / self.targetFps), self.pollSnapshot)
+            else:
+                self.drawModel()     
         self.rootWindow.mainloop()
 
+        # let the worker finish the step it is in, so the model is not left half updated
+        if self.worker is not None:
+            self.worker.join()
+
     def quitGUI(self):
         self.running = False # HS 06/29/2020
+        self.quitting = True
         self.rootWindow.quit()
         plt.close('all') # HS 06/29/2020
         self.rootWindow.destroy()
@@ -0,0 +1,150 @@
+"""
+Fast renderer for the simulation environment
+
+The figure used to be cleared and rebuilt every time step: four new scatter plots, a new casualty plot and a
+tight_layout() call. The Renderer creates its artists once and only updates their data from a snapshot of the
+simulation (Simulation.snapshot()), so drawing a frame no longer depends on building Python lists of agents.
+
+Frames can be decimated by rendering only every Nth time step and/or at most a number of frames per second. Above a
+population size threshold the agents are no longer drawn as markers but as a rasterized density image, a 2D histogram
+per display state blended with the state colours.
+
+Example:
+    renderer = Renderer(every=5, max_fps=10)
+    if renderer.draw(sim.snapshot()):
+        renderer.figure.savefig(f"{sim.time}_agents.png")
+"""
+
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.colors import to_rgb
+
+# The colour of every display state (susceptible, carrier, infected, immune). The agents are drawn in this order, so
+# immune agents are drawn on top as they were with one scatter plot per state.
+state_colours = np.array([to_rgb(colour) for colour in ("green", "yellow", "red", "grey")])
+
+# Population size above which the density view is used, and its resolution.
+density_threshold = 20000
+density_bins = 100
+
+
+class Renderer:
+    """
+    Draws the agents and the total casualties of a simulation into a figure with persistent artists.
+    """
+
+    def __init__(self, figure=None, every=1, max_fps=None, density_threshold=density_threshold, bins=density_bins):
+        """
+        Draw into "figure" (default: the current figure when the first frame is drawn). Only every "every"-th time
+        step is drawn and, if max_fps is given, at most max_fps frames per second of wall clock time.
+        """
+        self.figure = None
+        self.every = max(int(every), 1)
+        self.max_fps = max_fps
+        self.density_threshold = density_threshold
+        self.bins = bins
+        self.last_draw = None
+        self.last_time = None
+
+        if figure is not None:
+            self.setup(figure)
+
+    def setup(self, figure):
+        """
+        This function creates the axes and artists in the figure. It is called again if the figure changes, e.g. when
+        the GUI window has been closed and a new figure opened.
+        """
+        figure.clear()
+        self.figure = figure
+
+        # The environment, with the agents as one scatter plot and the density image, only one of them is visible.
+        self.agents_axes = figure.add_subplot(3, 1, (1, 2))
+        self.agents = self.agents_axes.scatter(np.zeros(0), np.zeros(0), marker='o', edgecolor='black')
+        self.density = self.agents_axes.imshow(np.ones((self.bins, self.bins, 3)), extent=(0, 1, 0, 1),
+                                               origin='lower', interpolation='nearest', visible=False)
+        self.agents_axes.axis('scaled')
+        self.agents_axes.axis([0, 1, 0, 1])
+        self.agents_title = self.agents_axes.set_title('t = 0')
+
+        # plot the total casualties over time
+        self.casualties_axes = figure.add_subplot(3, 1, 3)
+        self.casualties, = self.casualties_axes.plot([], [], color='orange')
+        self.casualties_axes.set_title('Total casualties')
+
+        figure.tight_layout()
+
+    def should_draw(self, time_step):
+        """
+        This function checks whether the frame of a time step is due, given the decimation settings.
+        """
+        if time_step % self.every != 0:
+            return False
+        if self.max_fps is not None and self.last_draw is not None:
+            return time.perf_counter() - self.last_draw >= 1 / self.max_fps
+        return True
+
+    def draw(self, snapshot, force=False):
+        """
+        This function updates the artists from a snapshot of the simulation, if the frame is due or force is set.
+        Returns whether the frame was drawn.
+        """
+        if not force and not self.should_draw(snapshot["time"]):
+            return False
+
+        # (Re)create the artists if there is no figure yet or the figure has been replaced.
+        figure = self.figure if self.figure is not None and plt.fignum_exists(self.figure.number) else plt.gcf()
+        if figure is not self.figure:
+            self.setup(figure)
+
+        x = snapshot["x"]
+        y = snapshot["y"]
+        display_state = snapshot["display_state"]
+
+        if len(x) > self.density_threshold:
+            self.density.set_data(self.density_image(x, y, display_state))
+            self.density.set_visible(True)
+            self.agents.set_visible(False)
+        else:
+            # Draw the agents grouped by display state, in the order of state_colours.
+            order = np.argsort(display_state, kind='stable')
+            self.agents.set_offsets(np.column_stack([x[order], y[order]]))
+            self.agents.set_facecolors(state_colours[display_state[order]])
+            self.agents.set_visible(True)
+            self.density.set_visible(False)
+
+        self.agents_title.set_text(f't = {snapshot["time"]}_vaccination_rate_{snapshot["vac_rate"]}')
+
+        total_casualty_ts = snapshot["total_casualty_ts"]
+        self.casualties.set_data(np.arange(len(total_casualty_ts)), total_casualty_ts)
+        self.casualties_axes.relim()
+        self.casualties_axes.autoscale_view()
+
+        self.figure.canvas.draw_idle()
+        self.last_draw = time.perf_counter()
+        self.last_time = snapshot["time"]
+        return True
+
+    def density_image(self, x, y, display_state):
+        """
+        This function rasterizes the agents into an RGB image: the colour of every pixel is the mix of the state colours
+        of the agents in it, and its darkness grows with the (log) number of agents.
+        """
+        cell = np.minimum((x * self.bins).astype(np.int64), self.bins - 1) * self.bins + \
+            np.minimum((y * self.bins).astype(np.int64), self.bins - 1)
+
+        # A 2D histogram per display state, flattened.
+        counts = np.zeros((len(state_colours), self.bins * self.bins))
+        for state in range(len(state_colours)):
+            counts[state] = np.bincount(cell[display_state == state], minlength=self.bins * self.bins)
+
+        total = counts.sum(axis=0)
+        colour = (counts.T @ state_colours) / np.maximum(total, 1)[:, None]
+        intensity = np.log1p(total) / np.log1p(max(total.max(), 1))
+
+        # Empty pixels are white, crowded pixels take the full colour of their mix of states.
+        image = 1 - intensity[:, None] * (1 - colour)
+
+        # The histogram is indexed [x, y], images are indexed [row (y), column (x)].
+        return image.reshape(self.bins, self.bins, 3).transpose(1, 0, 2)
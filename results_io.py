@@ -0,0 +1,199 @@
+"""
+Columnar result format
+
+The statistics of a run are stored in a "statistics" directory inside its vac_rate_X directory: a small header.json
+with the parameters and summary of the run, and one .npy file per column (each time series and each column of the final
+agent state, e.g. agents.x, and of the transmission log, e.g. transmissions.infector). The columns are typed arrays that are only read when they are asked for and are memory
+mapped, so a single time series can be loaded without touching the rest of the run.
+
+Runs saved before this format (statistics.pkl) are read through the same interface.
+
+Example:
+    runs = load_simulation_dir("Simulations/covid_2023-04-23-18-45-35")
+    runs["vac_rate_0"]["total_casualty_ts"][-1]
+"""
+
+import json
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from population import state_names
+
+format_version = 1
+
+# Name of the directory holding the columns of a run, and of the pickle used by earlier runs.
+results_name = "statistics"
+legacy_name = "statistics.pkl"
+
+# Prefix of the columns holding the final agent state, and of the columns holding the transmission log.
+agents_prefix = "agents."
+transmissions_prefix = "transmissions."
+
+# Types of the time series columns.
+series_dtypes = {"infected_ts": np.int64,
+                 "total_infected_ts": np.int64,
+                 "casualty_ts": np.int64,
+                 "total_casualty_ts": np.int64,
+                 "basic_reproduction_number_ts": np.float64}
+
+
+def save_results(path, statistics, header=None):
+    """
+    This function writes the time series and final agent columns in "statistics" (as returned by
+    Simulation.statistics()) to the results directory "path", with "header" stored in header.json.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    # Collect the columns, flattening the agent and transmission columns into agents.<name> and transmissions.<name>.
+    columns = {name: np.asarray(statistics[name], dtype=dtype) for name, dtype in series_dtypes.items()
+               if name in statistics}
+    for name, values in statistics.get("agents", {}).items():
+        columns[agents_prefix + name] = np.asarray(values)
+    for name, values in statistics.get("transmissions", {}).items():
+        columns[transmissions_prefix + name] = np.asarray(values)
+
+    for name, values in columns.items():
+        np.save(path / f"{name}.npy", values)
+
+    # Write the header last so a directory with a header is always complete.
+    header = dict(header or {}, format=format_version,
+                  columns={name: {"dtype": values.dtype.str, "length": len(values)} for name, values in columns.items()})
+    with open(path / "header.json", "w") as handle:
+        json.dump(header, handle, indent=2, default=float)
+
+    return path
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    """
+    Unpickler for statistics.pkl files written before the columnar format. Those pickled the agents as instances of the
+    agent class of the script that ran them, which is replaced here by a plain stand-in class.
+    """
+
+    class agent:
+        pass
+
+    def find_class(self, module, name):
+        if name == "agent":
+            return self.agent
+        return super().find_class(module, name)
+
+
+def legacy_agent_columns(agents):
+    """
+    This function converts a list of legacy agent objects to agent columns.
+    """
+    return {"x": np.array([ag.x for ag in agents], dtype=np.float64),
+            "y": np.array([ag.y for ag in agents], dtype=np.float64),
+            "state": np.array([state_names.index(ag.type) for ag in agents], dtype=np.int8),
+            "immune": np.array([ag.immune for ag in agents], dtype=np.bool_),
+            "no_infected": np.array([ag.no_infected for ag in agents], dtype=np.int32)}
+
+
+class Results:
+    """
+    Lazy reader for the results of a single run. Columns are loaded (memory mapped) when first accessed and cached.
+    Works like a read-only dictionary of column name to array.
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        Open the results in "path", which can be the results directory, a vac_rate_X run directory or a legacy
+        statistics.pkl file.
+        """
+        path = Path(path)
+        if path.is_dir() and (path / results_name).is_dir():
+            path = path / results_name
+        elif path.is_dir() and (path / legacy_name).exists():
+            path = path / legacy_name
+
+        self.path = path
+        self.mmap_mode = "r" if mmap else None
+        self.columns = {}
+
+        if path.suffix == ".pkl":
+            # Legacy runs are read in full, there is nothing to load lazily in a pickle.
+            with open(path, "rb") as handle:
+                statistics = LegacyUnpickler(handle).load()
+            self.header = {"format": 0}
+            for name in series_dtypes:
+                self.columns[name] = np.asarray(statistics[name], dtype=series_dtypes[name])
+            for name, values in legacy_agent_columns(statistics["agents"]).items():
+                self.columns[agents_prefix + name] = values
+            self.header["columns"] = {name: {"dtype": values.dtype.str, "length": len(values)}
+                                      for name, values in self.columns.items()}
+        else:
+            with open(path / "header.json") as handle:
+                self.header = json.load(handle)
+
+    @property
+    def params(self):
+        return self.header.get("params", {})
+
+    def keys(self):
+        return self.header["columns"].keys()
+
+    def __contains__(self, name):
+        return name in self.header["columns"]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.header["columns"])
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            if name not in self:
+                raise KeyError(name)
+            self.columns[name] = np.load(self.path / f"{name}.npy", mmap_mode=self.mmap_mode)
+        return self.columns[name]
+
+    def items(self):
+        return ((name, self[name]) for name in self.keys())
+
+    def agents(self):
+        """
+        This function returns the final agent state as a dictionary of columns.
+        """
+        return {name[len(agents_prefix):]: self[name] for name in self.keys() if name.startswith(agents_prefix)}
+
+    def transmissions(self):
+        """
+        This function returns the transmission log as a dictionary of columns. Runs saved without a log return an
+        empty dictionary.
+        """
+        return {name[len(transmissions_prefix):]: self[name] for name in self.keys()
+                if name.startswith(transmissions_prefix)}
+
+    def load(self, columns=None):
+        """
+        This function reads the given columns (default: all of them) into memory and returns them as a dictionary.
+        """
+        return {name: np.array(self[name]) for name in (columns or self.keys())}
+
+
+def load_results(path, columns=None, mmap=True):
+    """
+    This function opens the results of a run. If "columns" is given, only those columns are read and returned as a
+    dictionary, otherwise the lazy Results reader is returned.
+    """
+    results = Results(path, mmap=mmap)
+    if columns is None:
+        return results
+    return results.load(columns)
+
+
+def load_simulation_dir(path, mmap=True):
+    """
+    This function opens every run in a Simulations/<virus>_<timestamp> directory and returns a dictionary of the
+    vac_rate_X directory names to their Results.
+    """
+    runs = {}
+    for run_path in sorted(Path(path).iterdir()):
+        if (run_path / results_name / "header.json").exists() or (run_path / legacy_name).exists():
+            runs[run_path.name] = Results(run_path, mmap=mmap)
+    return runs
@@ -0,0 +1,223 @@
+"""
+SQLite index of simulation runs
+
+Every run is registered in a local SQLite database with its parameters, its summary metrics (final totals, peak daily
+infections and the day of the peak, final basic reproduction number, duration) and the path of its full results.
+Questions across runs, such as the casualties per vaccination rate of a virus, become a single indexed query, and only
+the time series that are needed are then read from disk (see results_io.py).
+
+Sweeps and the GUI register the runs they save. Runs saved before the index, including the legacy statistics.pkl
+runs, are added with backfill(), which skips the runs that are already indexed and unchanged.
+
+Example, the casualties per vaccination rate of the marburg runs:
+    index = RunIndex()
+    index.backfill("Simulations")
+    index.query("SELECT vac_rate, total_casualties FROM runs WHERE virus = ? ORDER BY vac_rate", "marburg")
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+from results_io import Results, results_name, legacy_name
+
+default_index_path = Path("Simulations") / "runs.sqlite"
+
+# Output directories are named <virus>_<timestamp> by the GUI and sweep.py.
+timestamp_pattern = re.compile(r"_\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}$")
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    experiment TEXT,
+    virus TEXT,
+    vac_rate REAL,
+    seed INTEGER,
+    engine TEXT,
+    params TEXT,
+    days INTEGER,
+    total_infected INTEGER,
+    total_casualties INTEGER,
+    peak_daily_infected INTEGER,
+    peak_day INTEGER,
+    final_r0 REAL,
+    stop_reason TEXT,
+    modified REAL,
+    registered REAL
+);
+CREATE INDEX IF NOT EXISTS runs_virus_vac_rate ON runs (virus, vac_rate);
+CREATE INDEX IF NOT EXISTS runs_experiment ON runs (experiment);
+"""
+
+
+def results_file(run_path):
+    """
+    This function returns the file whose modification time tells if a run has changed: its header.json, or its
+    statistics.pkl for legacy runs.
+    """
+    run_path = Path(run_path)
+    if (run_path / results_name / "header.json").exists():
+        return run_path / results_name / "header.json"
+    return run_path / legacy_name
+
+
+def run_summary(results):
+    """
+    This function returns the summary metrics of a run from its Results.
+    """
+    daily_infected = np.asarray(results["infected_ts"])
+    reproduction = np.asarray(results["basic_reproduction_number_ts"])
+    header = results.header
+
+    # Legacy runs have no header, and their GUI kept appending zeros after the epidemic was over. They record no daily
+    # count of carriers or infected agents, so their duration is taken as the last day with new infections or
+    # casualties.
+    days = header.get("days")
+    if days is None:
+        active = np.flatnonzero((daily_infected != 0) | (np.asarray(results["casualty_ts"]) != 0))
+        days = int(active[-1]) if len(active) > 0 else 0
+
+    return {"days": days,
+            "total_infected": int(header.get("total_infected", np.asarray(results["total_infected_ts"])[-1])),
+            "total_casualties": int(header.get("total_casualties", np.asarray(results["total_casualty_ts"])[-1])),
+            "peak_daily_infected": int(daily_infected.max(initial=0)),
+            "peak_day": int(daily_infected.argmax()) if len(daily_infected) > 0 else 0,
+            "final_r0": float(reproduction[-1]) if len(reproduction) > 0 else 0.0,
+            "stop_reason": header.get("stop_reason")}
+
+
+def sweep_virus(experiment_path):
+    """
+    This function returns the virus recorded in the sweep.json of an experiment directory, or None if it has none.
+    """
+    try:
+        with open(Path(experiment_path) / "sweep.json") as handle:
+            return json.load(handle).get("virus")
+    except (OSError, ValueError):
+        return None
+
+
+class RunIndex:
+    """
+    Connection to the run index database.
+    """
+
+    def __init__(self, path=default_index_path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def register(self, run_path, experiment=None, virus=None):
+        """
+        This function adds the run in the vac_rate_X directory "run_path" to the index, or updates it. The experiment
+        is the name of the output directory the run belongs to, by default the parent of the run directory, and the
+        virus defaults to the start of the experiment name (<virus>_<timestamp>). Returns the id of the run.
+        """
+        run_path = Path(run_path).resolve()
+        if experiment is None:
+            experiment = run_path.parent.name
+
+        results = Results(run_path)
+        summary = run_summary(results)
+        params = results.params
+
+        # The vaccination rate and virus of legacy runs are only known from their directory names.
+        vac_rate = params.get("vac_rate")
+        if vac_rate is None and run_path.name.startswith("vac_rate_"):
+            vac_rate = float(run_path.name[len("vac_rate_"):])
+        if virus is None:
+            virus = timestamp_pattern.sub("", experiment).split("_")[0]
+
+        row = dict(summary,
+                   path=str(run_path),
+                   experiment=experiment,
+                   virus=virus,
+                   vac_rate=vac_rate,
+                   seed=results.header.get("seed"),
+                   engine=results.header.get("engine"),
+                   params=json.dumps(params),
+                   modified=results_file(run_path).stat().st_mtime,
+                   registered=time.time())
+
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{name}" for name in row)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in row if name != "path")
+        with self.connection:
+            self.connection.execute(f"INSERT INTO runs ({columns}) VALUES ({placeholders}) "
+                                    f"ON CONFLICT (path) DO UPDATE SET {updates}", row)
+        return self.connection.execute("SELECT id FROM runs WHERE path = ?", (str(run_path),)).fetchone()["id"]
+
+    def backfill(self, root="Simulations"):
+        """
+        This function registers every run below the directory "root" that is not indexed yet or has changed since it
+        was indexed, using the top level directory below root as the experiment and the virus recorded by the sweep
+        that made it, if any. Result cache entries are skipped.
+        Returns the number of runs registered.
+        """
+        root = Path(root)
+        indexed = {row["path"]: row["modified"] for row in self.connection.execute("SELECT path, modified FROM runs")}
+
+        registered = 0
+        run_paths = {path.parent.parent for path in root.rglob(f"{results_name}/header.json")}
+        run_paths |= {path.parent for path in root.rglob(legacy_name)}
+        for run_path in sorted(run_paths):
+            if (run_path / "entry.json").exists():
+                continue
+            if indexed.get(str(run_path.resolve())) == results_file(run_path).stat().st_mtime:
+                continue
+
+            experiment = run_path.relative_to(root).parts[0]
+            self.register(run_path, experiment=experiment, virus=sweep_virus(root / experiment))
+            registered += 1
+        return registered
+
+    def query(self, sql, *args):
+        """
+        This function runs an SQL query on the index and returns the rows.
+        """
+        return self.connection.execute(sql, args).fetchall()
+
+    def runs(self, **filters):
+        """
+        This function returns the runs whose columns equal the given values, e.g. runs(virus="covid"), ordered by
+        experiment and vaccination rate.
+        """
+        where = " AND ".join(f"{name} = ?" for name in filters) or "1"
+        return self.query(f"SELECT * FROM runs WHERE {where} ORDER BY experiment, vac_rate", *filters.values())
+
+    def results(self, run):
+        """
+        This function opens the full results of an indexed run, so its time series are read lazily.
+        """
+        return Results(run["path"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the simulation runs in a SQLite database.")
+    parser.add_argument("root", nargs="?", type=Path, default=Path("Simulations"), help="directory of the runs")
+    parser.add_argument("--index", type=Path, default=default_index_path, help="index database")
+    args = parser.parse_args(argv)
+
+    with RunIndex(args.index) as index:
+        print(f"Registered {index.backfill(args.root)} runs in {args.index}")
+
+
+if __name__ == "__main__":
+    main()
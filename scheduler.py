@@ -0,0 +1,127 @@
+"""
+Event-driven disease progression
+
+With the "event" engine the carrier to infected, recovery and death transitions are not polled each time an agent
+happens to be picked by update(). When an agent is infected, its whole course is scheduled on a priority heap of timed
+events instead: the end of its incubation period, and either its recovery or its death. Movement and infection still
+happen through the random agent updates, and the events are processed in time order between them, so every transition
+costs O(log N) and the disease clocks no longer advance at random.
+
+The day of death is sampled once at infection by inverting the cumulative death hazard over the days of the infection,
+using the same per-day death probability table as the other engines (Simulation.build_death_table()). The immunity of the
+agent at the time of infection is used for the whole course.
+
+Example:
+    sim = Simulation(virus_dict["covid"], pop_init=10000, engine="event")
+    sim.run(until=100)
+"""
+
+import heapq
+
+import numpy as np
+
+from population import CARRIER, INFECTED
+
+# Event kinds.
+INCUBATION = 0
+RECOVERY = 1
+DEATH = 2
+
+
+class EventScheduler:
+    """
+    Priority heap of (time, sequence number, kind, agent id) events. The sequence number keeps events at the same time
+    in the order they were scheduled.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, time, kind, agent):
+        """
+        This function schedules an event of "kind" for the agent with id "agent" at "time".
+        """
+        heapq.heappush(self.heap, (time, self.seq, kind, agent))
+        self.seq += 1
+
+    def schedule_infection(self, sim, i):
+        """
+        This function schedules the course of the infection of the agent in row i, which has just been infected (as a
+        carrier) or starts the simulation infected.
+        """
+        pop = sim.population
+        agent = int(pop.ids[i])
+        start = sim.clock
+        rec_time = float(pop.rec_time[i])
+
+        # Carriers become infected at the end of their incubation period, on the infected time at which update() would
+        # have found carrier_time < infected_time.
+        if pop.state[i] == CARRIER:
+            incubation = start + float(pop.carrier_time[i])
+            self.push(incubation, INCUBATION, agent)
+            first_day = int(pop.carrier_time[i]) + 1
+        else:
+            incubation = start
+            first_day = 0
+
+        # The infected times at which the agent can die, up to the one at which it recovers, and the probability of
+        # dying by each of them.
+        days = np.arange(first_day, int(rec_time) + 2)
+        probability = sim.death_probabilities(days, np.full(len(days), pop.immune[i]))
+        cumulative = 1 - np.cumprod(1 - probability)
+
+        died = np.flatnonzero(sim.rng.random_sample() < cumulative)
+        if len(died) > 0:
+            self.push(max(start + min(days[died[0]], rec_time), incubation), DEATH, agent)
+        else:
+            self.push(max(start + rec_time, incubation), RECOVERY, agent)
+
+    def run_until(self, sim, time):
+        """
+        This function processes every event up to and including "time", in time order.
+        """
+        pop = sim.population
+        heap = self.heap
+
+        while heap and heap[0][0] <= time:
+            _, _, kind, agent = heapq.heappop(heap)
+
+            # Skip events of agents that are gone or no longer in the state the event expects.
+            i = pop.row_of[agent]
+            if i < 0:
+                continue
+
+            if kind == INCUBATION:
+                if pop.state[i] == CARRIER:
+                    sim.incubate(i)
+            elif pop.state[i] == INFECTED:
+                if kind == DEATH:
+                    sim.kill(i)
+                else:
+                    sim.recover(i)
+
+    def columns(self):
+        """
+        This function returns the pending events as columns, for checkpoints.
+        """
+        events = sorted(self.heap)
+        return {"time": np.array([event[0] for event in events], dtype=np.float64),
+                "seq": np.array([event[1] for event in events], dtype=np.int64),
+                "kind": np.array([event[2] for event in events], dtype=np.int8),
+                "agent": np.array([event[3] for event in events], dtype=np.int64)}
+
+    @classmethod
+    def from_columns(cls, columns, seq):
+        """
+        This function rebuilds a scheduler from the columns of its pending events and its sequence counter.
+        """
+        scheduler = cls()
+        scheduler.heap = list(zip(columns["time"].tolist(), columns["seq"].tolist(), columns["kind"].tolist(),
+                                  columns["agent"].tolist()))
+        heapq.heapify(scheduler.heap)
+        scheduler.seq = seq
+        return scheduler
@@ -0,0 +1,690 @@
+"""
+Headless viral infection simulation engine
+
+This module holds the agent based model without any GUI, plotting or user prompts so it can be imported and run on
+machines without a display. The pycxsimulator GUI in viral_sim_base.py is a thin client of the Simulation class below.
+
+Example:
+    sim = Simulation(virus_dict["covid"], vac_rate=0.3)
+    sim.run(until=100)
+    sim.total_casualty_ts[-1]
+"""
+
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+from population import Population, SUSCEPTIBLE, CARRIER, INFECTED
+from profiling import Profiler
+from random_blocks import BlockRandom
+from scheduler import EventScheduler
+from results_io import save_results, results_name
+from spatial_index import CellList
+from stopping import MaxDays, default_conditions
+from transmission import TransmissionLog, ReproductionTracker
+import sync_engine
+
+# Updating schemes: "async" updates randomly chosen agents one at a time, "sync" advances the whole population once per
+# time unit with batched NumPy operations (see sync_engine.py), and "event" moves and infects randomly chosen agents one
+# at a time like "async" but progresses the disease through scheduled events (see scheduler.py).
+engines = ("async", "sync", "event")
+
+# Ways of finding the nearest infectious agent: a uniform grid index, or a scan over every infectious agent that is kept
+# as the reference implementation.
+neighbour_searches = ("grid", "brute")
+
+# Random number generators: the "legacy" RandomState draws one number per call and reproduces the runs of earlier
+# versions, "block" draws numbers in large blocks from a numpy Generator (see random_blocks.py).
+generators = ("legacy", "block")
+
+# Version of the model behaviour, part of the key of cached results (see cache.py). It has to be increased by every change
+# that changes the outcome of a run for the same parameters and seed.
+engine_version = 1
+
+# Default values
+default_params = {"max_infection_rate": 0.9,
+                  "case_fatality_rate": 0.025,
+                  "min_recovery_period": 14,
+                  "max_recovery_period": 31,
+                  "min_carrier_period": 1,
+                  "max_carrier_period": 5,
+                  "pop_init": 300,  # initial population
+                  "infected_init": 1,  # number of 'infected' agents at initialisation
+                  "vac_rate": 0,  # percentage of agents that are immune (vaccinated) at the start
+                  "speed": 0.05,  # movement speed (diffusion rate)
+                  "cd": 0.05}  # neighborhood radius
+
+# Dictionary to store the virus attributes.
+virus_dict = {"covid": {"max_infection_rate": 0.9,
+                        "case_fatality_rate": 0.025,
+                        "min_recovery_period": 11,
+                        "max_recovery_period": 20,
+                        "min_carrier_period": 4,
+                        "max_carrier_period": 6},
+
+              "marburg": {"max_infection_rate": 0.9,
+                          "case_fatality_rate": 0.88,
+                          "min_recovery_period": 14,
+                          "max_recovery_period": 31,
+                          "min_carrier_period": 2,
+                          "max_carrier_period": 7}}
+
+# Parameters that are stored as integers, the rest are floats.
+int_params = {"min_recovery_period", "max_recovery_period", "min_carrier_period", "max_carrier_period",
+              "pop_init", "infected_init"}
+
+
+class Simulation:
+    """
+    A single run of the viral infection model. The state that used to live in module globals (agents, time, the time
+    series and the deceased cases) is held on the instance, so several simulations can exist in one process. The
+    agents are stored column-wise in a Population.
+    """
+
+    def __init__(self, params=None, seed=42, output_path=None, neighbour_search="grid", engine="async", debug=False,
+                 profile=False, generator="legacy", initialize=True, **overrides):
+        """
+        Build a simulation from a parameter dict, such as an entry of virus_dict. Missing keys fall back to
+        default_params and keyword arguments override both. The simulation is initialised straight away, unless
+        initialize is False because its state is restored from a checkpoint (see checkpoint.py). With debug the
+        incrementally maintained state counts are cross-checked against a full scan after every time step, and with
+        profile the time spent in each phase of a step is recorded in self.profiler (see profiling.py). The generator
+        picks the random number generator, one of "generators".
+        """
+        if neighbour_search not in neighbour_searches:
+            raise ValueError(f"neighbour_search must be one of {neighbour_searches}, not {neighbour_search!r}")
+        if engine not in engines:
+            raise ValueError(f"engine must be one of {engines}, not {engine!r}")
+        if generator not in generators:
+            raise ValueError(f"generator must be one of {generators}, not {generator!r}")
+        self.neighbour_search = neighbour_search
+        self.engine = engine
+        self.debug = debug
+        self.generator = generator
+        self.profiler = Profiler() if profile else None
+        self.population = None
+        self.scheduler = None
+        self.stop_reason = None
+
+        self.params = dict(default_params)
+        self.set_params(**dict(params or {}, **overrides))
+
+        self.seed = seed
+        self.output_path = Path(output_path) if output_path is not None else None
+
+        if initialize:
+            self.initialize()
+
+    def set_params(self, **params):
+        """
+        This function updates the model parameters and recomputes the values derived from them. Parameters that only
+        matter at initialisation (pop_init, infected_init, vac_rate) take effect on the next initialize().
+        """
+        for name, val in params.items():
+            if name not in default_params:
+                raise KeyError(f"Unknown parameter: {name}")
+
+            # Numbers are kept as given so the output directories match the GUI naming (vac_rate_0, vac_rate_0.1).
+            if name in int_params:
+                val = int(val)
+            elif not isinstance(val, (int, float)):
+                val = float(val)
+            self.params[name] = val
+
+        # load the parameters.
+        for name, val in self.params.items():
+            setattr(self, name, val)
+
+        # Death probability option 1, inverse geometric. So the cumulative probability up to the mean recovery is
+        # roughly equal to the case fatality. After this point the probabilities are mirrored and decrease as the agent
+        # gets closer to recovery.
+        self.mean_recovery_period = round((self.min_recovery_period + self.max_recovery_period) / 2)
+        self.prob_death = 1 - (self.case_fatality_rate ** (1 / self.mean_recovery_period))
+
+        # Time frames in which each agent recovers and is a carrier.
+        self.rec_time_range = [self.min_recovery_period, self.max_recovery_period]
+        self.carrier_time_range = [self.min_carrier_period, self.max_carrier_period]
+
+        # Lookup table of the death probability for every infected time, so the agent updates do no power arithmetic.
+        self.build_death_table()
+        self.cd_squared = self.cd ** 2
+
+        # The cell size of the grid index depends on cd, so rebuild it for a running simulation.
+        if self.population is not None:
+            self.build_index()
+
+    def build_death_table(self, infected_time=0):
+        """
+        This function tabulates the death probability per time step for every infected time up to the longest
+        carrier and infected period, or up to infected_time if that is longer, for agents that are not immune (row 0)
+        and immune (row 1).
+        """
+        days = range(max(int(self.max_carrier_period + self.max_recovery_period) + 3, infected_time + 1))
+
+        # Lists are faster to index with a single infected time.
+        self.death_rows = [[self.death_probability(day, immune) for day in days] for immune in (False, True)]
+        self.death_table = np.array(self.death_rows)
+
+    def death_probability(self, infected_time, immune):
+        """
+        This function returns the probability of death in this time step for an infected agent with the given infected
+        time and immunity. It is computed with Python floats, as the agent update always did, since NumPy powers can
+        differ in the last bit.
+        """
+        # agent dies from infection with some probability. death prob option 1
+        probability_timestep = (self.max_recovery_period - infected_time) - 1
+
+        if probability_timestep < self.mean_recovery_period:
+            probability_timestep = self.max_recovery_period - probability_timestep
+
+        dynamic_prob_death = ((1 - self.prob_death) ** probability_timestep) * self.prob_death
+        dynamic_prob_death = min(dynamic_prob_death, self.case_fatality_rate / 2)
+
+        # If the agent is immune they are less likely to die from the infection.
+        if immune:
+            dynamic_prob_death = dynamic_prob_death / 10
+        return dynamic_prob_death
+
+    def death_probabilities(self, infected_time, immune):
+        """
+        This function looks up the death probabilities for arrays of infected times and immunity.
+        """
+        infected_time = infected_time.astype(np.int64)
+        if len(infected_time) > 0 and infected_time.max() >= self.death_table.shape[1]:
+            self.build_death_table(int(infected_time.max()))
+        return self.death_table[immune.astype(np.int64), infected_time]
+
+    def seed_rng(self, seed):
+        """
+        This function seeds the simulation with a new random number generator of the chosen kind.
+        """
+        self.seed = seed
+        self.rng = np.random.RandomState(seed) if self.generator == "legacy" else BlockRandom(seed)
+
+    def build_index(self):
+        """
+        This function (re)builds the grid index of the infectious agents from the population.
+        """
+        self.index = None
+
+        # The synchronous engine builds its own grid every step.
+        if self.neighbour_search != "grid" or self.engine == "sync":
+            return
+
+        pop = self.population
+        self.index = CellList(self.cd)
+        for i in np.concatenate([pop.rows(CARRIER), pop.rows(INFECTED)]):
+            self.index.insert(i, pop.x[i], pop.y[i])
+
+    def nearest_infectious(self, i):
+        """
+        This function finds the infectious (carrier or infected) agent closest to the agent in row i. Returns the row
+        of the neighbour and the squared distance to it, or None if there is no infectious agent to consider.
+        """
+        pop = self.population
+
+        # Only the neighbouring cells can hold an agent within cd, agents further away have no chance of infection.
+        if self.index is not None:
+            return self.index.nearest(pop.x[i], pop.y[i], pop.x, pop.y)
+
+        # Get the rows of the infected and carrier agents, in row order so ties go to the same agent as in a scan.
+        infectious = np.sort(np.concatenate([pop.rows(CARRIER), pop.rows(INFECTED)]))
+
+        if len(infectious) == 0:
+            return None
+
+        # Get the distances to the infected agents and the closest of them.
+        squared_distance_to_infected = (pop.x[i] - pop.x[infectious]) ** 2 + (pop.y[i] - pop.y[infectious]) ** 2
+        closest = np.argmin(squared_distance_to_infected)
+
+        return infectious[closest], squared_distance_to_infected[closest]
+
+    def initialize(self):
+        """
+        This function initializes the simulation. It spawns the agents, assigns them types and random co-ordinates
+        within the environment.
+        """
+        # The population of agents and the variable to store the time step we are currently on.
+        self.population = Population(self.pop_init)
+        # The clock is the time within the current time step, used to order the events of the event engine.
+        self.time = 0
+        self.clock = 0
+        self.stop_reason = None
+
+        # Set the seed here so that the agent initialization is constant and reproducible.
+        self.seed_rng(self.seed)
+
+        # The directory for the output of this run, following the Simulations/<virus>_<timestamp>/vac_rate_X layout.
+        self.current_output_path = None
+        if self.output_path is not None:
+            self.current_output_path = self.output_path / f"vac_rate_{str(self.vac_rate)}"
+
+        # The log of every infection, the running totals of the basic reproduction number estimate and the ids of the
+        # agents newly infected this time step.
+        self.transmissions = TransmissionLog()
+        self.reproduction = ReproductionTracker()
+        self.new_infections = []
+
+        # initialise population, with batched draws for the synchronous engine.
+        pop = self.population
+        if self.engine == "sync":
+            sync_engine.initialize_population(self)
+
+        for i in range(self.pop_init if self.engine != "sync" else 0):
+
+            # randomly assign immune to "vac_rate"% of agents.
+            if self.rng.random_sample() < self.vac_rate:
+                pop.immune[i] = True
+
+            # start with just 1 infected agent.
+            if i >= self.pop_init - self.infected_init:
+                # Give the agent type infected, an attribute to store the time infected and a randomly sampled
+                # recovery time from a uniform distribution between a minimum and maximum.
+                pop.state[i] = INFECTED
+                pop.prior_infection[i] = True
+                pop.new_infection[i] = True
+                pop.infected_time[i] = 0
+                pop.rec_time[i] = self.rng.uniform(self.rec_time_range[0], self.rec_time_range[1])
+
+            # Assign a random x and y value to the agent.
+            pop.x[i] = self.rng.random_sample()
+            pop.y[i] = self.rng.random_sample()
+
+        # Index the agents by state, including the initial infected agents, then the infectious agents by position.
+        pop.recount()
+        initial = pop.ids[pop.rows(INFECTED)]
+        self.new_infections.extend(initial.tolist())
+        self.transmissions.extend(0, -1, initial, True)
+        self.build_index()
+
+        # Schedule the course of the initial infections for the event engine.
+        self.scheduler = None
+        if self.engine == "event":
+            self.scheduler = EventScheduler()
+            for i in pop.rows(INFECTED):
+                self.scheduler.schedule_infection(self, i)
+
+        # initialise the metrics and time series.
+        self.total_casualties = 0
+        self.total_infected = 0
+        self.daily_infected = 0
+        self.daily_casualties = 0
+
+        self.casualty_ts = [0]
+        self.infected_ts = [0]
+
+        self.total_infected_ts = [self.total_infected]
+        self.total_casualty_ts = [self.total_casualties]
+        self.basic_reproduction_number_ts = [0]
+
+    def vaccinate(self, rate):
+        """
+        This function tops up the immunity of the live agents to "rate"% with a vaccination campaign, e.g. in a branch
+        forked from a checkpoint. Only susceptible agents that are not immune yet are vaccinated, chosen at random, and
+        if there are too few of them all are. Returns the number of agents vaccinated.
+        """
+        pop = self.population
+        needed = round(rate * len(pop)) - int(np.count_nonzero(pop.live("immune")))
+        candidates = pop.rows(SUSCEPTIBLE)
+        if needed <= 0 or len(candidates) == 0:
+            return 0
+
+        # Sort the candidates first, the order of the state index depends on its history.
+        candidates = np.sort(candidates)
+        vaccinated = candidates[np.argsort(self.rng.random_sample(len(candidates)), kind="stable")[:needed]]
+        for i in vaccinated:
+            pop.set_immune(i)
+        return len(vaccinated)
+
+    def is_finished(self):
+        """
+        This function checks if the epidemic is over, i.e. there are no carrier or infected agents left.
+        """
+        return self.population.count(CARRIER) + self.population.count(INFECTED) == 0
+
+    def update(self):
+        """
+        This function updates a randomly chosen agent (asynchronous updating).
+        """
+        # if there are no infectious agents left, the epidemic is over and there is nothing to update.
+        if self.is_finished():
+            return
+
+        # Time the phases of the update if profiling is on.
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+
+        # randomly choose an agent to move (asynchronous updating)
+        pop = self.population
+        i = self.rng.randint(pop.n)
+
+        # simulate random movement before agent interactions
+        pop.x[i] = min(max(pop.x[i] + self.rng.uniform(-self.speed, self.speed), 0), 1)
+        pop.y[i] = min(max(pop.y[i] + self.rng.uniform(-self.speed, self.speed), 0), 1)
+
+        state = pop.state[i]
+
+        # Keep the grid index up to date with the movement of infectious agents.
+        if self.index is not None and state != SUSCEPTIBLE:
+            self.index.move(i, pop.x[i], pop.y[i])
+
+        if profiler is not None:
+            start = profiler.lap("movement", start)
+
+        # susceptible behaviour
+        if state == SUSCEPTIBLE:
+
+            # Get the closest infected agent.
+            nearest = self.nearest_infectious(i)
+
+            if profiler is not None:
+                start = profiler.lap("neighbour_search", start)
+
+            # If we have an infected agent to consider, within cd so the infection rate is non-zero.
+            if nearest is not None and nearest[1] < self.cd_squared:
+
+                # Get the distance from the current agent to this neighbour.
+                closest_nb, squared_distance = nearest
+                distance = math.sqrt(squared_distance)
+
+                # Scale the infection rate dependent on the distance between the agents. If the agent is immune
+                # (vaccinated or recovered) the chance of infection is lowered, and so it is if the neighbour is immune.
+                # The motivation is that an immune agent will have a lower viral load, meaning the virus is not present
+                # in large amounts.
+                infection_rate = self.max_infection_rate * (1 - distance / self.cd)
+                if pop.immune[i]:
+                    infection_rate = infection_rate / 5
+                if pop.immune[closest_nb]:
+                    infection_rate = infection_rate / 5
+
+                # Check if the agent has got infected.
+                if self.rng.random_sample() < infection_rate:
+                    self.infect(i, closest_nb)
+                    state = CARRIER
+
+            if profiler is not None:
+                start = profiler.lap("infection", start)
+
+        # With the event engine the disease progresses through scheduled events instead (see scheduler.py).
+        if self.scheduler is not None:
+            return
+
+        # carrier behaviour
+        if state == CARRIER:
+
+            # After the incubation period the carrier becomes an infected.
+            if pop.carrier_time[i] < pop.infected_time[i]:
+                self.incubate(i)
+                state = INFECTED
+            else:
+                # Otherwise, increase the time by one unit.
+                pop.infected_time[i] += 1
+
+        # infected behaviour
+        if state == INFECTED:
+
+            # agent dies from infection with some probability (death prob option 1), which is lower if the agent is
+            # immune. The probabilities are tabulated in build_death_table().
+            infected_time = int(pop.infected_time[i])
+            if infected_time >= len(self.death_rows[0]):
+                self.build_death_table(infected_time)
+            dynamic_prob_death = self.death_rows[int(pop.immune[i])][infected_time]
+
+            random_death = self.rng.random_sample()
+
+            # Check if the agent has died.
+            if random_death < dynamic_prob_death:
+                self.kill(i)
+
+            # agent recovers and becomes immune if they survive until recovery.
+            elif pop.rec_time[i] < pop.infected_time[i]:
+                self.recover(i)
+
+            # If they survive, update the infected time for this agent.
+            else:
+                pop.infected_time[i] += 1
+
+        if profiler is not None and state != SUSCEPTIBLE:
+            profiler.lap("progression", start)
+
+    def infect(self, i, closest_nb):
+        """
+        This function infects the susceptible agent in row i through its neighbour in row closest_nb.
+        """
+        pop = self.population
+
+        # If this agent was not previously infected, add them to the neighbours secondary infections for the basic
+        # reproduction number
+        first = not pop.prior_infection[i]
+        if first:
+            pop.prior_infection[i] = True
+            pop.new_infection[i] = True
+            pop.no_infected[closest_nb] += 1
+            self.new_infections.append(int(pop.ids[i]))
+
+            # The neighbour may already count towards the estimate.
+            if pop.state[closest_nb] == INFECTED and not pop.new_infection[closest_nb]:
+                self.reproduction.add(1, 0)
+
+        self.transmissions.append(self.time, pop.ids[closest_nb], pop.ids[i], first)
+
+        # Change the agent to a carrier type
+        pop.set_state(i, CARRIER)
+
+        # Set up the agent with a recovery time, carrier time and infected time.
+        pop.rec_time[i] = self.rng.uniform(self.rec_time_range[0], self.rec_time_range[1])
+        pop.carrier_time[i] = self.rng.uniform(self.carrier_time_range[0], self.carrier_time_range[1])
+        pop.infected_time[i] = 0
+
+        if self.index is not None:
+            self.index.insert(i, pop.x[i], pop.y[i])
+
+        # Schedule the course of the infection.
+        if self.scheduler is not None:
+            self.scheduler.schedule_infection(self, i)
+
+        # Add this infection to the metrics.
+        self.daily_infected += 1
+        self.total_infected += 1
+
+    def incubate(self, i):
+        """
+        This function turns the carrier in row i into an infected agent at the end of its incubation period.
+        """
+        pop = self.population
+        pop.set_state(i, INFECTED)
+
+        # Infected agents count towards the estimate once their infection is no longer new.
+        if not pop.new_infection[i]:
+            self.reproduction.add(pop.no_infected[i])
+
+    def kill(self, i):
+        """
+        This function removes the infected agent in row i, which died of the infection.
+        """
+        pop = self.population
+
+        # Their secondary cases keep counting towards the basic reproduction number metric.
+        if pop.new_infection[i]:
+            self.reproduction.add(pop.no_infected[i])
+        moved = pop.remove(i)
+
+        # Drop the agent from the grid index and follow the agent that was moved into its row.
+        if self.index is not None:
+            self.index.remove(i)
+            if moved is not None and pop.state[i] != SUSCEPTIBLE:
+                self.index.relabel(moved, i)
+
+        # Add the casualty to the metrics.
+        self.total_casualties += 1
+        self.daily_casualties += 1
+
+    def recover(self, i):
+        """
+        This function makes the infected agent in row i recover, after which it is immune.
+        """
+        pop = self.population
+        if not pop.new_infection[i]:
+            self.reproduction.discard(pop.no_infected[i])
+        pop.set_immune(i)
+        pop.set_state(i, SUSCEPTIBLE)
+
+        if self.index is not None:
+            self.index.remove(i)
+
+    def update_one_unit_time(self):
+        """
+        Each "update" should result in each agent moving an average of 1 time.
+        """
+        # Increase the number of time steps that have been performed.
+        self.time += 1
+
+        # Initialise variables to store the daily infected and daily casualties.
+        self.daily_infected = 0
+        self.daily_casualties = 0
+
+        if self.engine == "sync":
+            # Advance every agent once.
+            sync_engine.step(self)
+        elif self.engine == "event":
+            # Update randomly chosen agents as below, processing the disease events that are due in between.
+            t = 0
+            while t < 1:
+                t += 1 / len(self.population)
+                self.clock = self.time - 1 + t
+                self.scheduler.run_until(self, self.clock)
+                self.update()
+            self.clock = self.time
+            self.scheduler.run_until(self, self.clock)
+        else:
+            # Perform an update for every agent.
+            # Note: The agents updated are chosen randomly, so an agent may not be updated in a time step.
+            t = 0
+            while t < 1:
+                t += 1 / len(self.population)
+                self.update()
+
+        if self.profiler is not None:
+            start = time.perf_counter()
+
+        # update infected and casualty time series
+        self.infected_ts.append(self.daily_infected)
+        self.casualty_ts.append(self.daily_casualties)
+        self.total_infected_ts.append(self.total_infected)
+        self.total_casualty_ts.append(self.total_casualties)
+
+        # Average the number of secondary cases. These are the cases that have been confirmed, the infected agents
+        # excluding new infections from the current time step and the deceased agents, kept as running totals.
+        self.basic_reproduction_number_ts.append(self.reproduction.estimate())
+
+        # then reset it for the next time step, for the new infections that are still alive. The ones that are infected
+        # now count towards the estimate.
+        pop = self.population
+        rows = pop.row_of[np.array(self.new_infections, dtype=np.int64)]
+        rows = rows[rows >= 0]
+        pop.new_infection[rows] = False
+        infected = rows[pop.state[rows] == INFECTED]
+        self.reproduction.add(pop.no_infected[infected].sum(), len(infected))
+        self.new_infections = []
+
+        # Cross-check the state index against a full scan of the population.
+        if self.debug:
+            pop.check_index()
+
+        if self.profiler is not None:
+            self.profiler.lap("metrics", start)
+            self.profiler.end_step(self.time)
+
+    def should_stop(self, conditions):
+        """
+        This function checks the stopping conditions (see stopping.py) in order and records the reason of the first one
+        that holds in stop_reason. Returns True if the run should stop.
+        """
+        for condition in conditions:
+            if condition.check(self):
+                self.stop_reason = condition.reason
+                return True
+        return False
+
+    def run(self, until=None, stop=None):
+        """
+        This function runs the simulation until one of the stopping conditions in "stop" holds, by default until the
+        epidemic is over, or until the time step "until" has been reached. The reason is recorded in stop_reason and
+        the statistics are saved once at the end if the simulation was given an output path.
+        """
+        conditions = default_conditions(until) if stop is None else list(stop)
+        if stop is not None and until is not None:
+            conditions.append(MaxDays(until))
+        for condition in conditions:
+            condition.start()
+
+        self.stop_reason = None
+        while not self.should_stop(conditions):
+            self.update_one_unit_time()
+
+        if self.output_path is not None:
+            self.save_statistics()
+
+        return self
+
+    def snapshot(self):
+        """
+        This function returns a copy of what is needed to draw the current state of the simulation: the time, the
+        vaccination rate, the positions and display states of the agents, the total casualty time series and why the
+        run stopped, if it has.
+        """
+        pop = self.population
+        return {"time": self.time,
+                "stop_reason": self.stop_reason,
+                "vac_rate": self.vac_rate,
+                "x": pop.live("x").copy(),
+                "y": pop.live("y").copy(),
+                "display_state": pop.display_state(),
+                "total_casualty_ts": np.array(self.total_casualty_ts)}
+
+    def statistics(self):
+        """
+        This function returns the time series, final agent state and transmission log of the simulation as a dictionary.
+        """
+        return {"infected_ts": self.infected_ts,
+                "total_infected_ts": self.total_infected_ts,
+                "casualty_ts": self.casualty_ts,
+                "total_casualty_ts": self.total_casualty_ts,
+                "basic_reproduction_number_ts": self.basic_reproduction_number_ts,
+                "agents": self.population.to_dict(),
+                "transmissions": self.transmissions.columns()}
+
+    def header(self):
+        """
+        This function returns the parameters and summary of the run that are stored with its statistics.
+        """
+        return {"params": self.params,
+                "seed": self.seed,
+                "engine": self.engine,
+                "generator": self.generator,
+                "engine_version": engine_version,
+                "neighbour_search": self.neighbour_search,
+                "days": self.time,
+                "total_infected": self.total_infected,
+                "total_casualties": self.total_casualties,
+                "stop_reason": self.stop_reason}
+
+    def save_statistics(self, path=None):
+        """
+        This function saves the statistics of the simulation in the columnar result format (see results_io.py). By
+        default they are written to the statistics directory in the current output path.
+        """
+        if path is None:
+            path = self.current_output_path / results_name
+
+        if self.profiler is not None:
+            start = time.perf_counter()
+
+        path = save_results(path, self.statistics(), self.header())
+
+        if self.profiler is not None:
+            self.profiler.lap("save", start)
+        return path
@@ -0,0 +1,122 @@
+"""
+Uniform grid (cell list) index over the infectious agents
+
+The unit square is split into square cells that are at least as wide as the neighbourhood radius cd. An agent closer
+than cd to a point is then always in the cell of that point or one of its 8 neighbouring cells, so the nearest
+infectious neighbour lookup only needs to check those cells instead of every infectious agent.
+"""
+
+import math
+
+import numpy as np
+
+# Number of candidates up to which the nearest neighbour is found with a plain Python loop.
+small_search = 24
+
+
+class CellList:
+    """
+    A uniform grid over the unit square holding the population rows of the infectious agents. The index has to be kept
+    up to date by the caller as agents move, change state or are swap-removed from the population.
+    """
+
+    def __init__(self, cell_size):
+        """
+        Create an empty grid with cells strictly wider than cell_size. One cell fewer is used when 1 / cell_size is a
+        whole number so floating point rounding can never put two agents closer than cell_size two cells apart.
+        """
+        self.n_cells = max(1, math.ceil(1 / cell_size) - 1)
+
+        # Dictionary mapping a cell to the set of rows in it, and the reverse mapping from row to cell.
+        self.cells = {}
+        self.cell_of = {}
+
+    def __len__(self):
+        return len(self.cell_of)
+
+    def __contains__(self, row):
+        return row in self.cell_of
+
+    def cell(self, x, y):
+        """
+        This function returns the cell containing the point (x, y).
+        """
+        n = self.n_cells
+        return min(int(x * n), n - 1), min(int(y * n), n - 1)
+
+    def insert(self, row, x, y):
+        """
+        This function adds the agent in "row" at (x, y) to the index.
+        """
+        cell = self.cell(x, y)
+        self.cells.setdefault(cell, set()).add(row)
+        self.cell_of[row] = cell
+
+    def remove(self, row):
+        """
+        This function removes the agent in "row" from the index.
+        """
+        cell = self.cell_of.pop(row)
+        members = self.cells[cell]
+        members.discard(row)
+        if not members:
+            del self.cells[cell]
+
+    def move(self, row, x, y):
+        """
+        This function updates the cell of the agent in "row" after it has moved to (x, y).
+        """
+        cell = self.cell(x, y)
+        if cell != self.cell_of[row]:
+            self.remove(row)
+            self.cells.setdefault(cell, set()).add(row)
+            self.cell_of[row] = cell
+
+    def relabel(self, old_row, new_row):
+        """
+        This function renames an indexed agent after the population moved it from old_row to new_row.
+        """
+        cell = self.cell_of.pop(old_row)
+        members = self.cells[cell]
+        members.discard(old_row)
+        members.add(new_row)
+        self.cell_of[new_row] = cell
+
+    def nearest(self, x, y, xs, ys):
+        """
+        This function finds the indexed agent nearest to (x, y) among the cell of the point and its neighbouring cells.
+        xs and ys are the position columns of the population. Ties are broken by the lowest row, matching a brute force
+        search over the rows in order. Returns the row and the squared distance, or None if no agent is nearby.
+        """
+        cx, cy = self.cell(x, y)
+
+        # Collect the rows in the 3x3 block of cells around the point.
+        rows = []
+        for i in range(cx - 1, cx + 2):
+            for j in range(cy - 1, cy + 2):
+                members = self.cells.get((i, j))
+                if members:
+                    rows.extend(members)
+
+        if not rows:
+            return None
+
+        # For a handful of candidates a plain loop is cheaper than building arrays.
+        if len(rows) <= small_search:
+            closest_row = None
+            closest_distance = None
+            for row in rows:
+                squared_distance = (x - xs[row]) ** 2 + (y - ys[row]) ** 2
+                if (closest_row is None or squared_distance < closest_distance or
+                        (squared_distance == closest_distance and row < closest_row)):
+                    closest_row = row
+                    closest_distance = squared_distance
+
+            return closest_row, closest_distance
+
+        # Otherwise get the closest agent with NumPy, sorting the rows first so the first minimum has the lowest row.
+        rows = np.sort(np.array(rows))
+        squared_distance = (x - xs[rows]) ** 2 + (y - ys[rows]) ** 2
+        closest = np.argmin(squared_distance)
+
+        return rows[closest], squared_distance[closest]
@@ -0,0 +1,100 @@
+"""
+Stopping conditions of a run
+
+A run stops at the end of the first time step at which one of its stopping conditions holds: there are no infectious
+agents left, a number of days has been simulated, a wall clock budget has been used up or a number of infections has
+been reached. The reason is recorded in Simulation.stop_reason and stored with the statistics of the run, and both
+Simulation.run() and the GUI stop stepping once it is set, so a finished run no longer burns CPU or grows its time
+series.
+
+Example, stopping after 200 days, 10 minutes or 5000 infections, whichever comes first:
+    sim = Simulation(virus_dict["covid"], pop_init=10000)
+    sim.run(stop=[NoInfectious(), MaxDays(200), WallClock(600), TargetInfections(5000)])
+    sim.stop_reason
+"""
+
+from time import perf_counter
+
+
+class StopCondition:
+    """
+    A condition that stops a run. Subclasses set "reason" and implement check().
+    """
+    reason = None
+
+    def start(self):
+        """
+        This function is called when a run (re)starts, for conditions that keep state of their own.
+        """
+
+    def check(self, sim):
+        """
+        This function returns True if the run should stop.
+        """
+        raise NotImplementedError
+
+
+class NoInfectious(StopCondition):
+    """
+    Stops the run once there are no carrier or infected agents left, i.e. the epidemic is over.
+    """
+    reason = "no_infectious"
+
+    def check(self, sim):
+        return sim.is_finished()
+
+
+class MaxDays(StopCondition):
+    """
+    Stops the run once the time step "days" has been reached.
+    """
+    reason = "max_days"
+
+    def __init__(self, days):
+        self.days = days
+
+    def check(self, sim):
+        return sim.time >= self.days
+
+
+class WallClock(StopCondition):
+    """
+    Stops the run once "seconds" of wall time have passed since it started.
+    """
+    reason = "wall_clock"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = None
+
+    def start(self):
+        self.started = perf_counter()
+
+    def check(self, sim):
+        if self.started is None:
+            self.start()
+        return perf_counter() - self.started >= self.seconds
+
+
+class TargetInfections(StopCondition):
+    """
+    Stops the run once the cumulative number of infections has reached "total".
+    """
+    reason = "target_infections"
+
+    def __init__(self, total):
+        self.total = total
+
+    def check(self, sim):
+        return sim.total_infected >= self.total
+
+
+def default_conditions(until=None):
+    """
+    This function returns the conditions Simulation.run() uses when none are given: the end of the epidemic and, with
+    "until", the time step "until".
+    """
+    conditions = [NoInfectious()]
+    if until is not None:
+        conditions.append(MaxDays(until))
+    return conditions
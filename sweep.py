@@ -0,0 +1,213 @@
+"""
+Parallel parameter sweep
+
+Runs the simulation for every point of a grid over the model parameters, spread across a pool of worker processes,
+and writes the output in the same Simulations/<virus>_<timestamp>/vac_rate_X layout as the GUI. When parameters other
+than vac_rate are varied, each combination of them gets its own directory above the vac_rate_X directories.
+
+Runs go through the result cache (see cache.py) unless it is disabled, so a point that has been run before with the
+same parameters, seed and engine is copied from the cache instead of simulated again. --force re-simulates every point.
+The runs are registered in the run index (see run_index.py).
+
+Example, the vaccination rate sweep from the report on every core:
+    python sweep.py --virus marburg --grid vac_rate=0,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1.0
+"""
+
+import argparse
+import itertools
+import json
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from cache import ResultCache, default_cache_path, default_max_bytes
+from results_io import results_name
+from run_index import RunIndex, default_index_path
+from simulation import Simulation, default_params, virus_dict, engines
+
+# The vaccination rates used in the report.
+vac_rates = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+
+def parse_value(text):
+    """
+    This function parses a grid value, keeping whole numbers as integers so "0" gives the vac_rate_0 directory.
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_grid(specs):
+    """
+    This function parses grid specifications of the form name=v1,v2,... or name=start:stop:step (inclusive) into a
+    dictionary of parameter name to list of values.
+    """
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in default_params:
+            raise ValueError(f"Unknown parameter in grid: {name}")
+
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            count = int(round((stop - start) / step)) + 1
+            grid[name] = [round(start + i * step, 10) for i in range(count)]
+        else:
+            grid[name] = [parse_value(v) for v in values.split(",")]
+
+    return grid
+
+
+def expand_grid(grid):
+    """
+    This function returns every combination of the grid values as a list of dictionaries.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def task_seeds(seed, n):
+    """
+    This function derives n independent, reproducible seeds from a base seed.
+    """
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n)]
+
+
+def point_output_path(output_path, point):
+    """
+    This function returns the directory that holds the vac_rate_X directory of a grid point. Parameters other than
+    vac_rate get a directory level of their own, e.g. <output_path>/max_infection_rate_0.5/vac_rate_0.1.
+    """
+    for name, val in point.items():
+        if name != "vac_rate":
+            output_path = output_path / f"{name}_{val}"
+    return output_path
+
+
+def run_point(task):
+    """
+    This function runs the simulation for a single grid point and returns a summary of the run. It is executed in the
+    worker processes.
+    """
+    params, point, seed, output_path, until, cache, options = task
+
+    start = time.perf_counter()
+    if cache is None:
+        sim = Simulation(dict(params, **point), seed=seed, output_path=point_output_path(output_path, point), **options)
+        sim.run(until=until)
+        path, summary, cached = sim.current_output_path, sim.header(), False
+    else:
+        # Fetch the run from the cache, simulating it only if needed, and copy it into the layout of the sweep.
+        cache_path, max_bytes, force, started = cache
+        result_cache = ResultCache(cache_path, max_bytes, keep_since=started)
+        point_params = dict(params, **point)
+        results = result_cache.run(point_params, seed=seed, until=until, force=force, **options)
+        path = point_output_path(output_path, point) / f"vac_rate_{str(point_params['vac_rate'])}"
+        shutil.copytree(results.path, path / results_name, dirs_exist_ok=True)
+        summary, cached = results.header, result_cache.hits > 0
+
+    return {"point": point,
+            "seed": seed,
+            "path": str(path),
+            "days": summary["days"],
+            "total_infected": summary["total_infected"],
+            "total_casualties": summary["total_casualties"],
+            "cached": cached,
+            "seconds": time.perf_counter() - start}
+
+
+def run_sweep(params, grid, output_path, seed=42, workers=None, until=None, common_seed=False,
+              cache_path=default_cache_path, cache_max_bytes=default_max_bytes, force=False,
+              index_path=default_index_path, virus=None, **options):
+    """
+    This function runs every point of the grid on a process pool and returns the run summaries in grid order.
+    By default every point gets its own seed derived from "seed"; with common_seed every point uses "seed" itself, like
+    the GUI does for each vaccination rate. Runs are taken from the result cache in cache_path when they are in it,
+    unless cache_path is None or "force" is set. The runs are registered in the run index in index_path as runs of
+    "virus" (by default the start of the output directory name), unless index_path is None.
+    """
+    output_path = Path(output_path)
+    points = expand_grid(grid)
+    seeds = [seed] * len(points) if common_seed else task_seeds(seed, len(points))
+
+    # The entries used by this sweep are not evicted while it runs, so no worker removes an entry another one copies.
+    cache = (cache_path, cache_max_bytes, force, time.time()) if cache_path is not None else None
+    tasks = [(params, point, point_seed, output_path, until, cache, options)
+             for point, point_seed in zip(points, seeds)]
+
+    # Run the points across the pool, reporting each one as it finishes.
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_point, task): i for i, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            print(f"{result['point']}: {result['days']} days, {result['total_casualties']} casualties "
+                  f"({result['seconds']:.1f}s{', cached' if result['cached'] else ''})")
+
+    # Record what was run next to the output.
+    output_path.mkdir(parents=True, exist_ok=True)
+    with open(output_path / "sweep.json", "w") as handle:
+        json.dump({"virus": virus, "params": params, "grid": grid, "seed": seed, "common_seed": common_seed,
+                   "until": until, "options": options, "runs": results}, handle, indent=2)
+
+    if index_path is not None:
+        with RunIndex(index_path) as index:
+            for result in results:
+                index.register(result["path"], experiment=output_path.name, virus=virus)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the viral simulation over a grid of parameters in parallel.")
+    parser.add_argument("--virus", default="default",
+                        help="virus to take the base parameters from: " + ", ".join(virus_dict))
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=VALUES",
+                        help="parameter values to sweep, as name=v1,v2,... or name=start:stop:step. "
+                             "Can be repeated. Defaults to the vaccination rates 0, 0.1, ..., 1.0")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42, help="base seed for the per-point seeds")
+    parser.add_argument("--common-seed", action="store_true", help="use the base seed for every point")
+    parser.add_argument("--until", type=int, default=None, help="maximum number of days to simulate")
+    parser.add_argument("--engine", choices=engines, default="async", help="updating scheme of the simulation")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="output directory (default: Simulations/<virus>_<timestamp>)")
+    parser.add_argument("--cache", type=Path, default=default_cache_path,
+                        help=f"result cache directory (default: {default_cache_path})")
+    parser.add_argument("--no-cache", action="store_true", help="always simulate and do not store the runs")
+    parser.add_argument("--cache-max-gb", type=float, default=default_max_bytes / 2 ** 30,
+                        help="size of the result cache above which the least recently used runs are removed")
+    parser.add_argument("--force", action="store_true", help="re-simulate cached runs and replace them in the cache")
+    parser.add_argument("--index", type=Path, default=default_index_path,
+                        help=f"run index database (default: {default_index_path})")
+    parser.add_argument("--no-index", action="store_true", help="do not register the runs in the run index")
+    args = parser.parse_args(argv)
+
+    virus_name = args.virus.strip().lower()
+    if virus_name != "default" and virus_name not in virus_dict:
+        parser.error(f"unknown virus {args.virus!r}")
+    params = dict(default_params, **virus_dict.get(virus_name, {}))
+
+    grid = parse_grid(args.grid) if args.grid else {"vac_rate": vac_rates}
+
+    output_path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        output_path = Path.cwd() / "Simulations" / f"{virus_name}_{timestamp}"
+
+    run_sweep(params, grid, output_path, seed=args.seed, workers=args.workers, until=args.until,
+              common_seed=args.common_seed, cache_path=None if args.no_cache else args.cache,
+              cache_max_bytes=int(args.cache_max_gb * 2 ** 30), force=args.force,
+              index_path=None if args.no_index else args.index, virus=virus_name, engine=args.engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Vectorized synchronous update engine
+
+Instead of updating randomly chosen agents one at a time, every agent is advanced once per time unit with batched NumPy
+operations: all agents move, every susceptible agent is exposed to its nearest infectious agent from the start of the
+step, and then the carrier, death and recovery transitions are applied to the whole population. The per-agent rules
+are the same as in Simulation.update(), only the updating scheme differs.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from population import SUSCEPTIBLE, CARRIER, INFECTED
+
+
+def grid_size(radius):
+    """
+    This function returns the number of grid cells along each side of the unit square for a neighbourhood radius. The
+    cells are strictly wider than the radius, as in spatial_index.CellList.
+    """
+    return max(1, math.ceil(1 / radius) - 1)
+
+
+def nearest_neighbours(qx, qy, px, py, radius):
+    """
+    This function finds, for every query point (qx, qy), the nearest point in (px, py) among the grid cells within one
+    cell of the query. Points further away than that are more than "radius" away. Returns the index of the nearest point
+    (-1 if none was found) and the squared distance to it (inf if none was found).
+    """
+    n = grid_size(radius)
+
+    nearest = np.full(len(qx), -1, dtype=np.int64)
+    nearest_distance = np.full(len(qx), np.inf)
+
+    if len(px) == 0 or len(qx) == 0:
+        return nearest, nearest_distance
+
+    # Sort the points by cell and find where each cell starts and how many points it holds.
+    pcx = np.minimum((px * n).astype(np.int64), n - 1)
+    pcy = np.minimum((py * n).astype(np.int64), n - 1)
+    order = np.argsort(pcx * n + pcy, kind="stable")
+    cell_count = np.bincount(pcx * n + pcy, minlength=n * n)
+    cell_start = np.concatenate(([0], np.cumsum(cell_count)[:-1]))
+    px_sorted = px[order]
+    py_sorted = py[order]
+
+    qcx = np.minimum((qx * n).astype(np.int64), n - 1)
+    qcy = np.minimum((qy * n).astype(np.int64), n - 1)
+
+    # Check the 3x3 block of cells around every query, one candidate slot of every cell at a time.
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            cx = qcx + dx
+            cy = qcy + dy
+            valid = (cx >= 0) & (cx < n) & (cy >= 0) & (cy < n)
+            cell = np.where(valid, cx * n + cy, 0)
+            count = np.where(valid, cell_count[cell], 0)
+
+            # Order the queries by the number of candidates in the cell, most first, so the queries that have a k-th
+            # candidate are always a prefix of that order.
+            queries = np.argsort(-count, kind="stable")
+            count = count[queries]
+            start = cell_start[cell[queries]]
+            query_x = qx[queries]
+            query_y = qy[queries]
+            active = np.searchsorted(-count, -np.arange(count[0]), side="left")
+
+            for k, m in enumerate(active):
+                candidates = start[:m] + k
+                squared_distance = ((query_x[:m] - px_sorted[candidates]) ** 2 +
+                                    (query_y[:m] - py_sorted[candidates]) ** 2)
+
+                closer = np.flatnonzero(squared_distance < nearest_distance[queries[:m]])
+                nearest[queries[closer]] = order[candidates[closer]]
+                nearest_distance[queries[closer]] = squared_distance[closer]
+
+    return nearest, nearest_distance
+
+
+def initialize_population(sim):
+    """
+    This function sets the immunity, initial infections and positions of the population with batched draws.
+    """
+    pop = sim.population
+    n = pop.n
+
+    # randomly assign immune to "vac_rate"% of agents.
+    pop.immune[:n] = sim.rng.random_sample(n) < sim.vac_rate
+
+    # The last "infected_init" agents start infected with a sampled recovery time.
+    infected = np.arange(max(n - sim.infected_init, 0), n)
+    pop.state[infected] = INFECTED
+    pop.prior_infection[infected] = True
+    pop.new_infection[infected] = True
+    pop.infected_time[infected] = 0
+    pop.rec_time[infected] = sim.rng.uniform(sim.rec_time_range[0], sim.rec_time_range[1], len(infected))
+
+    # Assign a random x and y value to the agents.
+    pop.x[:n] = sim.rng.random_sample(n)
+    pop.y[:n] = sim.rng.random_sample(n)
+
+
+def step(sim):
+    """
+    This function advances every agent of the simulation by one time unit.
+    """
+    pop = sim.population
+    rng = sim.rng
+    n = pop.n
+
+    # Time the phases of the step if profiling is on.
+    profiler = sim.profiler
+    if profiler is not None:
+        start = time.perf_counter()
+
+    x = pop.live("x")
+    y = pop.live("y")
+    state = pop.live("state")
+    immune = pop.live("immune")
+    infected_time = pop.live("infected_time")
+
+    # simulate random movement before agent interactions
+    x[:] = np.clip(x + rng.uniform(-sim.speed, sim.speed, n), 0, 1)
+    y[:] = np.clip(y + rng.uniform(-sim.speed, sim.speed, n), 0, 1)
+
+    if profiler is not None:
+        start = profiler.lap("movement", start)
+
+    # susceptible behaviour, each susceptible agent meets the closest infectious agent at the start of the step.
+    susceptible = np.flatnonzero(state == SUSCEPTIBLE)
+    infectious = np.flatnonzero(state != SUSCEPTIBLE)
+
+    nearest, squared_distance = nearest_neighbours(x[susceptible], y[susceptible], x[infectious], y[infectious],
+                                                   sim.cd)
+    found = nearest >= 0
+    susceptible = susceptible[found]
+    closest_nb = infectious[nearest[found]]
+    distance = np.sqrt(squared_distance[found])
+
+    if profiler is not None:
+        start = profiler.lap("neighbour_search", start)
+
+    # Scale the infection rate dependent on the distance between the agents, lowering it for immune agents and immune
+    # neighbours.
+    infection_rate = sim.max_infection_rate * (1 - distance / sim.cd)
+    infection_rate = np.where(immune[susceptible], infection_rate / 5, infection_rate)
+    infection_rate = np.where(immune[closest_nb], infection_rate / 5, infection_rate)
+
+    # Check which agents have got infected.
+    infected = (infection_rate > 0) & (rng.random_sample(len(susceptible)) < infection_rate)
+    new = susceptible[infected]
+    source = closest_nb[infected]
+
+    # Agents that were not previously infected count towards the secondary infections of their neighbour, and towards
+    # the estimate of the basic reproduction number if the neighbour is already counted.
+    first = ~pop.prior_infection[new]
+    pop.prior_infection[new[first]] = True
+    pop.new_infection[new[first]] = True
+    sim.new_infections.extend(pop.ids[new[first]].tolist())
+    np.add.at(pop.no_infected, source[first], 1)
+    counted = (state[source[first]] == INFECTED) & ~pop.new_infection[source[first]]
+    sim.reproduction.add(np.count_nonzero(counted), 0)
+    sim.transmissions.extend(sim.time, pop.ids[source], pop.ids[new], first)
+
+    # Change the agents to carriers with a recovery time, carrier time and infected time.
+    pop.set_states(new, CARRIER)
+    pop.rec_time[new] = rng.uniform(sim.rec_time_range[0], sim.rec_time_range[1], len(new))
+    pop.carrier_time[new] = rng.uniform(sim.carrier_time_range[0], sim.carrier_time_range[1], len(new))
+    infected_time[new] = 0
+
+    # Add the infections to the metrics.
+    sim.daily_infected += len(new)
+    sim.total_infected += len(new)
+
+    if profiler is not None:
+        start = profiler.lap("infection", start)
+
+    # carrier behaviour, after the incubation period the carrier becomes an infected.
+    carrier = state == CARRIER
+    incubated = carrier & (pop.live("carrier_time") < infected_time)
+    pop.set_states(np.flatnonzero(incubated), INFECTED)
+    counted = incubated & ~pop.live("new_infection")
+    sim.reproduction.add(pop.live("no_infected")[counted].sum(), np.count_nonzero(counted))
+    infected_time[carrier & ~incubated] += 1
+
+    # infected behaviour, agents may die, recover or stay infected.
+    infected = np.flatnonzero(state == INFECTED)
+    dies = rng.random_sample(len(infected)) < sim.death_probabilities(infected_time[infected], immune[infected])
+    recovers = ~dies & (pop.rec_time[infected] < infected_time[infected])
+
+    recovered = infected[recovers]
+    counted = recovered[~pop.new_infection[recovered]]
+    sim.reproduction.discard(pop.no_infected[counted].sum(), len(counted))
+    immune[recovered] = True
+    pop.set_states(recovered, SUSCEPTIBLE)
+
+    infected_time[infected[~dies & ~recovers]] += 1
+
+    # Record the secondary cases of the dead agents and remove them from the population. The secondary cases of the
+    # dead keep counting towards the estimate, the ones infected this step start now.
+    dead = infected[dies]
+    counted = dead[pop.new_infection[dead]]
+    sim.reproduction.add(pop.no_infected[counted].sum(), len(counted))
+
+    pop.remove_rows(dead)
+
+    # Add the casualties to the metrics.
+    sim.total_casualties += len(dead)
+    sim.daily_casualties += len(dead)
+
+    if profiler is not None:
+        profiler.lap("progression", start)
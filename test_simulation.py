@@ -0,0 +1,373 @@
+"""
+Behaviour tests of the simulation and the tools around it
+
+Short runs of a small population that check the promises the faster code paths make, for example that the grid
+neighbour search gives the same trajectory as the brute force search.
+
+Example:
+    python -m pytest -q test_simulation.py
+"""
+
+import json
+import os
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from cache import ResultCache, cache_key, entry_name
+from calibration import calibrate, Calibration
+from checkpoint import save_checkpoint, load_checkpoint, fork
+from domain import TiledSimulation, tile_of, live_count
+from ensemble import StreamingSeries, Ensemble
+from gif_creation import main as gif_main, gif_name
+from population import Population, SUSCEPTIBLE, CARRIER, INFECTED, IMMUNE
+from results_io import Results, results_name
+from run_index import run_summary
+from scheduler import EventScheduler, INCUBATION, RECOVERY, DEATH
+from simulation import Simulation, virus_dict, engines, generators
+from stopping import NoInfectious, MaxDays, TargetInfections
+from sweep import main as sweep_main, task_seeds
+from transmission import secondary_cases
+
+# A small population and a few days keep every test to well under a second.
+pop_init = 300
+days = 20
+
+
+def make_simulation(seed=7, **options):
+    """
+    This function returns a small Covid simulation.
+    """
+    return Simulation(virus_dict["covid"], seed=seed, pop_init=pop_init, **options)
+
+
+def assert_same_run(a, b):
+    """
+    This function checks that two simulations have the same time series and the same final agents.
+    """
+    a, b = a.statistics(), b.statistics()
+    for name in ("infected_ts", "total_infected_ts", "casualty_ts", "total_casualty_ts",
+                 "basic_reproduction_number_ts"):
+        np.testing.assert_array_equal(a[name], b[name], err_msg=name)
+    for name, column in a["agents"].items():
+        np.testing.assert_array_equal(column, b["agents"][name], err_msg=name)
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_grid_matches_brute(engine):
+    grid = make_simulation(engine=engine, neighbour_search="grid").run(until=days)
+    brute = make_simulation(engine=engine, neighbour_search="brute").run(until=days)
+    assert grid.total_infected > 0
+    assert_same_run(grid, brute)
+
+
+@pytest.mark.parametrize("generator", generators)
+@pytest.mark.parametrize("engine", engines)
+def test_checkpoint_resume_matches_run_through(tmp_path, engine, generator):
+    through = make_simulation(engine=engine, generator=generator).run(until=days)
+
+    first = make_simulation(engine=engine, generator=generator).run(until=days // 2)
+    save_checkpoint(first, tmp_path / "checkpoint.npz")
+    resumed = load_checkpoint(tmp_path / "checkpoint.npz").run(until=days)
+
+    assert resumed.time == through.time
+    assert_same_run(through, resumed)
+
+
+def test_fork_vaccination_tops_up_susceptible_agents(tmp_path):
+    sim = make_simulation().run(until=days)
+    save_checkpoint(sim, tmp_path / "checkpoint.npz")
+    before = sim.population.to_dict()
+    assert before["immune"].mean() < 0.3
+
+    vaccinated, unchanged = fork(tmp_path / "checkpoint.npz", [{"vac_rate": 0.3}, {"vac_rate": 0.0}])
+    after = vaccinated.population.to_dict()
+    assert after["immune"].sum() == round(0.3 * len(after["ids"]))
+    newly = after["immune"] & ~before["immune"]
+    assert np.all(after["state"][newly] == SUSCEPTIBLE)
+    vaccinated.population.check_index()
+
+    # Lowering the rate vaccinates nobody and makes nobody susceptible again.
+    np.testing.assert_array_equal(unchanged.population.to_dict()["immune"], before["immune"])
+
+
+def test_streaming_series_matches_numpy():
+    rng = np.random.default_rng(1)
+    replicates = [np.cumsum(rng.integers(0, 5, size=rng.integers(5, 30))) for _ in range(40)]
+
+    series = StreamingSeries(origin=-0.5, width=1.0, bins=15)
+    for replicate in replicates:
+        series.add(replicate)
+
+    # Shorter replicates are extended with their final values.
+    length = max(len(replicate) for replicate in replicates)
+    stacked = np.array([np.concatenate([r, np.full(length - len(r), r[-1])]) for r in replicates], dtype=float)
+
+    assert series.count == len(replicates)
+    np.testing.assert_allclose(series.mean, stacked.mean(axis=0))
+    np.testing.assert_allclose(series.variance(), stacked.var(axis=0, ddof=1))
+    assert series.hist.sum(axis=1).tolist() == [len(replicates)] * length
+
+
+def test_ensemble_bands_match_numpy():
+    runs = [make_simulation(seed=seed).run(until=days).statistics() for seed in range(5)]
+
+    ensemble = Ensemble(bins=16)
+    for statistics in runs:
+        ensemble.add(statistics)
+    bands = ensemble.bands()
+
+    for name in ("total_infected_ts", "total_casualty_ts"):
+        stacked = np.array([run[name] for run in runs], dtype=float)
+        np.testing.assert_allclose(bands[name]["mean"], stacked.mean(axis=0), err_msg=name)
+        np.testing.assert_allclose(bands[name]["std"], stacked.std(axis=0, ddof=1), err_msg=name)
+
+
+def test_tiled_simulation_conserves_agents_and_cleans_up():
+    totals = {"tiled": [], "sync": []}
+    for seed in range(3):
+        with TiledSimulation(virus_dict["covid"], seed=seed, pop_init=3000, workers=4) as sim:
+            assert sim.grid == (2, 2)
+            names = [shared.name for shared in sim.tiles + [sim.control]]
+            processes = list(sim.processes)
+            sim.run(until=30)
+
+            # Every agent is owned by the tile it stands in, and the tiles add up to the totals.
+            for k, tile in enumerate(sim.tiles):
+                n = tile["counts"][live_count]
+                assert np.all(tile_of(sim.grid, tile["x"][:n], tile["y"][:n]) == k)
+            agents = sim.agents()
+            assert len(agents["ids"]) + sim.total_casualties == sim.pop_init
+            assert len(np.unique(agents["ids"])) == len(agents["ids"])
+            assert np.isin(agents["state"], (CARRIER, INFECTED)).sum() == sim.infectious
+            assert sum(sim.casualty_ts) == sim.total_casualties
+            totals["tiled"].append((sim.total_infected, sim.total_casualties))
+
+        # The workers have stopped and the shared memory has been unlinked.
+        assert not any(process.is_alive() for process in processes)
+        for name in names:
+            with pytest.raises(FileNotFoundError):
+                SharedMemory(name=name)
+
+        sync = Simulation(virus_dict["covid"], seed=seed, pop_init=3000, engine="sync").run(until=30)
+        totals["sync"].append((sync.total_infected, sync.total_casualties))
+
+    # The tiles draw from their own random streams, so the runs only agree on average.
+    np.testing.assert_allclose(np.mean(totals["tiled"], axis=0), np.mean(totals["sync"], axis=0), rtol=0.15)
+
+
+def test_cache_hit_miss_force_and_eviction(tmp_path):
+    covid = dict(virus_dict["covid"], pop_init=pop_init)
+    cache = ResultCache(tmp_path)
+
+    first = cache.run(covid, seed=1, until=days)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # Options that do not change the outcome share the entry.
+    assert cache_key(covid, 1, days)[0] == cache_key(covid, 1, days, neighbour_search="brute", profile=True)[0]
+    again = cache.run(covid, seed=1, until=days, neighbour_search="brute", debug=True)
+    assert (cache.hits, cache.misses) == (1, 1)
+    np.testing.assert_array_equal(again["total_infected_ts"], first["total_infected_ts"])
+
+    forced = cache.run(covid, seed=1, until=days, force=True)
+    assert (cache.hits, cache.misses) == (1, 2)
+    np.testing.assert_array_equal(forced["total_infected_ts"], first["total_infected_ts"])
+    assert len(cache.entries()) == 1
+
+    # With room for two entries, storing a third evicts the least recently used one.
+    cache.run(covid, seed=2, until=days)
+    entry_size = max(size for _, size, _ in cache.entries())
+    cache.max_bytes = 2 * entry_size + entry_size // 2
+    os.utime(cache.entry_path(cache_key(covid, 2, days)[0]) / entry_name, (1, 1))
+    cache.run(covid, seed=3, until=days)
+
+    assert len(cache.entries()) == 2
+    assert cache.get(cache_key(covid, 2, days)[0]) is None
+    assert cache.get(cache_key(covid, 1, days)[0]) is not None
+
+
+def test_event_engine_runs_to_the_end():
+    sim = make_simulation(engine="event").run(until=400)
+    assert sim.stop_reason == "no_infectious"
+    assert sim.is_finished()
+    assert sim.population.count(CARRIER) + sim.population.count(INFECTED) == 0
+    assert len(sim.population) + sim.total_casualties == sim.pop_init
+    assert sum(sim.casualty_ts) == sim.total_casualties
+
+
+@pytest.mark.parametrize("death_probability, kind, day", [(1.0, DEATH, 3), (0.0, RECOVERY, 7.3)])
+def test_event_schedule_days(death_probability, kind, day):
+    sim = make_simulation(engine="event")
+    pop = sim.population
+    i = pop.rows(INFECTED)[0]
+    pop.set_state(i, CARRIER)
+    pop.carrier_time[i] = 2.5
+    pop.rec_time[i] = 7.3
+    sim.clock = 10
+
+    # Record the infected times the death hazard is looked up for.
+    looked_up = []
+
+    def death_probabilities(days, immune):
+        looked_up.extend(days.tolist())
+        return np.full(len(days), death_probability)
+
+    sim.death_probabilities = death_probabilities
+    scheduler = EventScheduler()
+    scheduler.schedule_infection(sim, i)
+
+    # The agent is infected from day int(carrier_time) + 1 and can die up to day int(rec_time) + 1, but no later than
+    # it recovers.
+    assert looked_up == list(range(3, 9))
+    assert [(time, event) for time, _, event, _ in sorted(scheduler.heap)] == [(10 + 2.5, INCUBATION), (10 + day, kind)]
+
+
+def test_legacy_generator_reproduces_seed_42():
+    # The totals every 10 days of seed 42, unchanged since the agents were first stored in a Population.
+    sim = make_simulation(seed=42).run(until=60)
+    assert sim.total_infected_ts[::10] == [0, 16, 51, 88, 133, 190, 259]
+    assert sim.total_casualty_ts[::10] == [0, 0, 3, 3, 8, 13, 17]
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_block_generator_runs_to_the_end(engine):
+    sim = make_simulation(engine=engine, generator="block").run(until=400)
+    assert sim.stop_reason == "no_infectious"
+    assert sim.total_infected > 0
+    assert len(sim.population) + sim.total_casualties == sim.pop_init
+
+
+def test_population_index_follows_removals():
+    pop = Population(10)
+    pop.immune[[2, 5]] = True
+    pop.recount()
+    pop.set_states(np.array([1, 5, 9]), CARRIER)
+    pop.set_state(9, INFECTED)
+    pop.remove(1)
+    pop.remove(0)
+    pop.check_index()
+    assert [pop.count(state) for state in (SUSCEPTIBLE, IMMUNE, CARRIER, INFECTED)] == [5, 1, 1, 1]
+
+    # A batch of removals that includes the last rows.
+    pop.set_states(np.array([2, 3]), SUSCEPTIBLE)
+    pop.remove_rows(np.array([1, 3, 7]))
+    pop.check_index()
+    assert sorted(pop.live("ids").tolist()) == [2, 4, 5, 6, 8]
+    assert [pop.count(state) for state in (SUSCEPTIBLE, IMMUNE, CARRIER, INFECTED)] == [3, 1, 1, 0]
+
+    # Writing a column without the index is caught.
+    pop.state[3] = INFECTED
+    with pytest.raises(RuntimeError):
+        pop.check_index()
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_debug_run_with_deaths(engine):
+    # Debug mode cross-checks the state index against a full scan after every step.
+    sim = make_simulation(engine=engine, debug=True).run(until=60)
+    assert sim.total_casualties > 0
+    assert len(sim.population) + sim.total_casualties == sim.pop_init
+
+
+def test_run_summary_days(tmp_path):
+    # The legacy GUI kept appending zeros after the epidemic was over, the run had its last infection on day 144.
+    legacy = Results(Path(__file__).parent / "Simulations" / "covid_2023-04-23-18-45-35" / "vac_rate_0")
+    assert len(legacy["infected_ts"]) == 162
+    assert run_summary(legacy)["days"] == 144
+
+    sim = make_simulation().run(until=days)
+    sim.save_statistics(tmp_path / results_name)
+    assert run_summary(Results(tmp_path))["days"] == days
+
+
+@pytest.mark.parametrize("common_seed", [False, True])
+def test_sweep_seeds_and_layout(tmp_path, common_seed):
+    argv = ["--virus", "covid", "--grid", f"pop_init={pop_init}", "--grid", "vac_rate=0,0.5", "--until", "5",
+            "--workers", "1", "--seed", "7", "--no-cache", "--no-index", "--output", str(tmp_path / "sweep")]
+    sweep_main(argv + ["--common-seed"] if common_seed else argv)
+
+    with open(tmp_path / "sweep" / "sweep.json") as handle:
+        runs = json.load(handle)["runs"]
+    assert [run["seed"] for run in runs] == ([7, 7] if common_seed else task_seeds(7, 2))
+
+    # Every parameter other than vac_rate gets a directory level of its own.
+    for run, vac_rate in zip(runs, ("0", "0.5")):
+        path = tmp_path / "sweep" / f"pop_init_{pop_init}" / f"vac_rate_{vac_rate}"
+        assert Path(run["path"]) == path
+        assert Results(path).header["seed"] == run["seed"]
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_reproduction_totals_match_log(engine):
+    sim = make_simulation(engine=engine)
+    for _ in range(40):
+        sim.update_one_unit_time()
+
+        # The estimate counts the secondary cases of the infected agents and of the dead, rescanned from the log.
+        pop = sim.population
+        offspring = secondary_cases(sim.transmissions, sim.pop_init)
+        dead = np.setdiff1d(np.arange(sim.pop_init), pop.live("ids"))
+        counted = np.concatenate([pop.live("ids")[pop.live("state") == INFECTED], dead])
+        assert (sim.reproduction.secondary_cases, sim.reproduction.cases) == (offspring[counted].sum(), len(counted))
+    assert sim.total_casualties > 0
+
+
+def test_stopping_conditions():
+    sim = make_simulation().run(stop=[NoInfectious(), MaxDays(12)])
+    assert (sim.time, sim.stop_reason) == (12, "max_days")
+    assert len(sim.total_infected_ts) == 13
+
+    # The run stops at the end of the first step that reaches the target.
+    sim = make_simulation().run(stop=[NoInfectious(), TargetInfections(50)])
+    assert sim.stop_reason == "target_infections"
+    assert sim.total_infected_ts[-1] >= 50 > sim.total_infected_ts[-2]
+    assert sim.total_infected == sim.total_infected_ts[-1]
+
+
+def test_calibration_two_generations(tmp_path):
+    params = dict(virus_dict["covid"], pop_init=100)
+    options = dict(targets={"attack_rate": 0.5}, priors={"max_infection_rate": (0.1, 1.0)}, particles=6, generations=2,
+                   replicates=2, until=days, workers=1, cache_path=tmp_path / "calibration.jsonl")
+    result = calibrate(params, **options)
+
+    assert [step["generation"] for step in result["history"]] == [0, 1]
+    assert len(result["accepted"]) == 2
+    assert 0.1 <= result["best"]["max_infection_rate"] <= 1.0
+    assert result["distance"] == min(particle["distance"] for particle in result["accepted"])
+
+    # The summary statistics of every run are cached, so a rerun simulates nothing.
+    again = calibrate(params, **options)
+    assert again["history"][-1]["runs"] == 0
+    assert again["best"] == result["best"]
+
+
+def test_calibration_rejects_contradictory_priors(tmp_path):
+    priors = {"min_recovery_period": (30, 40), "max_recovery_period": (10, 20)}
+    with pytest.raises(ValueError, match="no candidate is valid"):
+        Calibration(virus_dict["covid"], {"attack_rate": 0.5}, priors, cache_path=tmp_path / "calibration.jsonl")
+
+
+def test_gif_creation_skips_up_to_date_runs(tmp_path, capsys):
+    agents_path = tmp_path / "covid" / "vac_rate_0" / "Plots" / "agents"
+    agents_path.mkdir(parents=True)
+    (tmp_path / "covid" / "vac_rate_0.5" / "Plots" / "agents").mkdir(parents=True)
+    for time_step, colour in enumerate(("red", "blue")):
+        Image.new("RGB", (16, 16), colour).save(agents_path / f"{time_step}_agents.png")
+
+    def build(*options):
+        gif_main([str(tmp_path), "--workers", "1", *options])
+        lines = capsys.readouterr().out.splitlines()
+        return {line.split(":")[0]: line.split(": ")[1].split(" (")[0] for line in lines if ": " in line}
+
+    assert build() == {"covid/vac_rate_0": "built from 2 frames", "covid/vac_rate_0.5": "no frames"}
+    built = (agents_path.parent.parent / gif_name).stat().st_mtime_ns
+    assert build()["covid/vac_rate_0"] == "up to date"
+    assert (agents_path.parent.parent / gif_name).stat().st_mtime_ns == built
+    assert build("--force")["covid/vac_rate_0"] == "built from 2 frames"
+
+    # A new frame makes the GIF out of date.
+    Image.new("RGB", (16, 16), "green").save(agents_path / "2_agents.png")
+    assert build()["covid/vac_rate_0"] == "built from 3 frames"
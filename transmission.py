@@ -0,0 +1,166 @@
+"""
+Transmission log and reproduction number tracking
+
+Every infection is appended to a TransmissionLog as (time, infector id, infectee id, first), where "first" marks the
+first infection of the infectee, which is the one that counts towards the secondary cases of the infector. The initial
+infected agents are logged at time 0 with infector -1. The log is array backed and only grows, so the infection tree of
+a run can be rebuilt after the run from the ids alone.
+
+The running estimate of the basic reproduction number is kept by a ReproductionTracker as a sum and a count of
+secondary cases that are updated when agents change state, so the estimate costs O(1) per time step.
+
+Example, the cohort reproduction number of a finished run:
+    log = TransmissionLog.from_columns(load_results(path).transmissions())
+    cohort_reproduction_number(log)
+"""
+
+import numpy as np
+
+# The columns of the log and their types.
+log_dtypes = {"time": np.int32,
+              "infector": np.int64,  # -1 for the initial infected agents
+              "infectee": np.int64,
+              "first": np.bool_}
+
+
+class TransmissionLog:
+    """
+    Append-only log of infections, stored column-wise in arrays that double in size when they are full.
+    """
+
+    def __init__(self, capacity=1024):
+        self.n = 0
+        for name, dtype in log_dtypes.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.n
+
+    def reserve(self, extra):
+        """
+        This function makes room for "extra" more entries, doubling the capacity as often as needed.
+        """
+        capacity = len(self.time)
+        if self.n + extra <= capacity:
+            return
+
+        while capacity < self.n + extra:
+            capacity *= 2
+        for name in log_dtypes:
+            column = np.zeros(capacity, dtype=log_dtypes[name])
+            column[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, column)
+
+    def append(self, time, infector, infectee, first):
+        """
+        This function logs a single infection.
+        """
+        self.reserve(1)
+        self.time[self.n] = time
+        self.infector[self.n] = infector
+        self.infectee[self.n] = infectee
+        self.first[self.n] = first
+        self.n += 1
+
+    def extend(self, time, infector, infectee, first):
+        """
+        This function logs a batch of infections that happened at the same time.
+        """
+        count = len(infectee)
+        self.reserve(count)
+        self.time[self.n:self.n + count] = time
+        self.infector[self.n:self.n + count] = infector
+        self.infectee[self.n:self.n + count] = infectee
+        self.first[self.n:self.n + count] = first
+        self.n += count
+
+    def columns(self):
+        """
+        This function returns copies of the logged entries of every column.
+        """
+        return {name: getattr(self, name)[:self.n].copy() for name in log_dtypes}
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        This function builds a log from columns, such as the ones saved with the statistics of a run.
+        """
+        log = cls(max(len(columns["infectee"]), 1))
+        log.extend(np.asarray(columns["time"]), np.asarray(columns["infector"]), np.asarray(columns["infectee"]),
+                   np.asarray(columns["first"]))
+        return log
+
+
+class ReproductionTracker:
+    """
+    Running sum and count of the secondary cases behind the basic reproduction number estimate. The estimate is the
+    mean number of secondary cases of the infected agents that were not newly infected in the current time step and of
+    the deceased agents. The engines report the transitions that change either set and the tracker adjusts its totals.
+    """
+
+    def __init__(self):
+        self.secondary_cases = 0
+        self.cases = 0
+
+    def add(self, secondary_cases, cases=1):
+        """
+        This function counts agents with the given (total) number of secondary cases into the estimate.
+        """
+        self.secondary_cases += int(secondary_cases)
+        self.cases += int(cases)
+
+    def discard(self, secondary_cases, cases=1):
+        """
+        This function takes agents with the given (total) number of secondary cases out of the estimate.
+        """
+        self.secondary_cases -= int(secondary_cases)
+        self.cases -= int(cases)
+
+    def estimate(self):
+        """
+        This function returns the current estimate, or 0 if no agent is counted.
+        """
+        if self.cases > 0:
+            return self.secondary_cases / self.cases
+        return 0
+
+
+def secondary_cases(log, n_agents=None):
+    """
+    This function returns the number of secondary cases of every agent id, counting the first infections caused.
+    """
+    infector = log.infector[:log.n][log.first[:log.n]]
+    infector = infector[infector >= 0]
+    if n_agents is None:
+        n_agents = int(max(log.infectee[:log.n].max(initial=-1), infector.max(initial=-1))) + 1
+    return np.bincount(infector, minlength=n_agents)
+
+
+def cohort_reproduction_number(log, days=None):
+    """
+    This function returns the cohort (case) reproduction number for every day: the mean number of secondary cases of
+    the agents whose first infection was on that day, or 0 for days without first infections. It only needs the log,
+    so it can be computed after the run.
+    """
+    first = log.first[:log.n]
+    time = log.time[:log.n][first]
+    infectee = log.infectee[:log.n][first]
+    if days is None:
+        days = int(time.max(initial=0)) + 1
+
+    offspring = secondary_cases(log, int(infectee.max(initial=-1)) + 1)[infectee]
+    cases = np.bincount(time, minlength=days)[:days]
+    total = np.bincount(time, weights=offspring, minlength=days)[:days]
+
+    return np.divide(total, cases, out=np.zeros(days), where=cases > 0)
+
+
+def infection_tree(log):
+    """
+    This function returns the infection tree of the run as a dictionary of infector id to the list of agent ids they
+    infected, with the initial infected agents under -1.
+    """
+    tree = {}
+    for infector, infectee in zip(log.infector[:log.n].tolist(), log.infectee[:log.n].tolist()):
+        tree.setdefault(infector, []).append(infectee)
+    return tree